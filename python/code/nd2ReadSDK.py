@@ -534,6 +534,51 @@ def Lim_FileGetImageData(fhandle, seq_index, bpicture):
     return imgmd
 
 
+_Lim_FileGetImageRectData = nd2sdk.Lim_FileGetImageRectData
+_Lim_FileGetImageRectData.argtypes = [LIMFILEHANDLE, LIMUINT, LIMUINT, LIMUINT, LIMUINT, LIMUINT,
+                                      LIMUINT, LIMUINT, c_void_p, LIMUINT, LIMINT,
+                                      POINTER(LIMLOCALMETADATA)]
+_Lim_FileGetImageRectData.restype = LIMRESULT
+
+def Lim_FileGetImageRectData(fhandle, seq_index, total_width, total_height, x, y, width, height, buffer, line_size, stretch_mode=0):
+    """
+    Copies a rectangular region of a frame into a buffer
+
+    The frame is scaled to total_width x total_height pixels and the region (x, y, width, height) of the scaled frame is copied into the buffer. To read a region at full resolution, use the image width and height as total_width and total_height. Unlike :func:`Lim_FileGetImageData`, no picture object is needed.
+
+    Args:
+        fhandle (uint): Handle to open file
+        seq_index (uint): Sequence index of frame
+        total_width (uint): Width of the scaled frame in pixels
+        total_height (uint): Height of the scaled frame in pixels
+        x (uint): Left edge of the region in the scaled frame
+        y (uint): Top edge of the region in the scaled frame
+        width (uint): Width of the region in pixels
+        height (uint): Height of the region in pixels
+        buffer (int): Address of a buffer of at least height * line_size bytes (e.g. np_array.ctypes.data)
+        line_size (uint): Number of bytes per row of the buffer
+        stretch_mode (int): Interpolation used for scaling
+
+    Returns:
+        imgmd (:class:`LIMLOCALMEDATA`): Object containing metadata of frame
+
+    Raises:
+        ND2SDKError: If error occurs reading the image
+
+    """
+
+    imgmd = LIMLOCALMETADATA()
+
+    limresult = _Lim_FileGetImageRectData(fhandle, seq_index, total_width, total_height,
+                                          x, y, width, height, buffer, line_size,
+                                          stretch_mode, imgmd)
+
+    if limresult != 0:
+        raise ND2SDKError(limresult)
+
+    return imgmd
+
+
 _Lim_FileGetExperiment = nd2sdk.Lim_FileGetExperiment
 _Lim_FileGetExperiment.argtypes = [LIMFILEHANDLE, POINTER(LIMEXPERIMENT)]
 _Lim_FileGetExperiment.restype = LIMRESULT
@@ -608,6 +653,86 @@ def Lim_GetSeqIndexFromCoords(handle_or_md, *coords):
 
     return seq_index
 
+_Lim_GetCoordsFromSeqIndex = nd2sdk.Lim_GetCoordsFromSeqIndex
+_Lim_GetCoordsFromSeqIndex.argtypes = [POINTER(LIMEXPERIMENT), LIMUINT, POINTER(LIMUINT)]
+_Lim_GetCoordsFromSeqIndex.restype = None
+
+def Lim_GetCoordsFromSeqIndex(handle_or_md, seq_index):
+    """
+    Returns the coordinates of an image specified by its index
+
+    This is the inverse of :func:`Lim_GetSeqIndexFromCoords`. The first argument can either be the handle to an open file or the structure returned by using :func:`Lim_FileGetExperiment`.
+
+    Args:
+        hdl_or_md (uint or structure): Handle to open file or metadata
+        seq_index (uint): Index of the image
+
+    Returns:
+        coords (list): Coordinates of the image (Time, Multipoint, Zstep, Other)
+
+    """
+
+    if type(handle_or_md) == int:
+        expmd = Lim_FileGetExperiment(handle_or_md)
+    else:
+        expmd = handle_or_md
+
+    coords_arr = (c_uint * 4)()
+
+    _Lim_GetCoordsFromSeqIndex(expmd, seq_index, coords_arr)
+
+    return list(coords_arr)
+
+_Lim_GetZStackHome = nd2sdk.Lim_GetZStackHome
+_Lim_GetZStackHome.argtypes = [LIMFILEHANDLE]
+_Lim_GetZStackHome.restype = LIMINT
+
+def Lim_GetZStackHome(fhandle):
+    """
+    Returns the home position of the Z-stack
+
+    The home position is the index of the Z plane that was at the home (reference) position of the Z drive during acquisition.
+
+    Args:
+        fhandle (uint): Handle to open file
+
+    Returns:
+        z_home (int): Zero-based index of the home plane
+
+    """
+
+    return _Lim_GetZStackHome(fhandle)
+
+_Lim_GetNextUserEvent = nd2sdk.Lim_GetNextUserEvent
+_Lim_GetNextUserEvent.argtypes = [LIMFILEHANDLE, POINTER(LIMUINT), POINTER(LIMFILEUSEREVENT)]
+_Lim_GetNextUserEvent.restype = LIMRESULT
+
+def Lim_GetNextUserEvent(fhandle, next_id=0):
+    """
+    Returns a user event recorded during acquisition (e.g. a stimulus)
+
+    Events are read one at a time. Start with next_id = 0 and pass the returned next_id to read the following event.
+
+    Args:
+        fhandle (uint): Handle to open file
+        next_id (uint): ID returned by the previous call (0 for the first event)
+
+    Returns:
+        event (:class:`LIMFILEUSEREVENT`): The event, or None if there are no more events
+        next_id (uint): ID to pass to the next call
+
+    """
+
+    event = LIMFILEUSEREVENT()
+    next_id = LIMUINT(next_id)
+
+    limresult = _Lim_GetNextUserEvent(fhandle, next_id, event)
+
+    if limresult != 0:
+        return None, next_id.value
+
+    return event, next_id.value
+
 _Lim_FileGetBinaryDescriptors = nd2sdk.Lim_FileGetBinaryDescriptors
 _Lim_FileGetBinaryDescriptors.argtypes = [LIMFILEHANDLE, POINTER(LIMBINARIES)]
 _Lim_FileGetBinaryDescriptors.restype = LIMRESULT
@@ -724,17 +849,12 @@ class ND2SDKError(Exception):
 
 #Additional functions (not yet converted)
 
-# LIMFILEAPI LIMRESULT       Lim_FileGetImageRectData(LIMFILEHANDLE hFile, LIMUINT uiSeqIndex, LIMUINT uiDstTotalW, LIMUINT uiDstTotalH, LIMUINT uiDstX, LIMUINT uiDstY, LIMUINT uiDstW, LIMUINT uiDstH, void* pBuffer, LIMUINT uiDstLineSize, LIMINT iStretchMode, LIMLOCALMETADATA* pImgInfo);
-
-# LIMFILEAPI void            Lim_GetCoordsFromSeqIndex(LIMEXPERIMENT* pExperiment, LIMUINT uiSeqIdx, LIMUINT* pExpCoords);
 # LIMFILEAPI LIMRESULT       Lim_GetMultipointName(LIMFILEHANDLE hFile, LIMUINT uiPointIdx, LIMWSTR wstrPointName);
-# LIMFILEAPI LIMINT          Lim_GetZStackHome(LIMFILEHANDLE hFile);
 # LIMFILEAPI LIMRESULT       Lim_GetLargeImageDimensions(LIMFILEHANDLE hFile, LIMUINT* puiXFields, LIMUINT* puiYFields, double* pdOverlap);
 
 # LIMFILEAPI LIMRESULT       Lim_GetRecordedDataInt(LIMFILEHANDLE hFile, LIMCWSTR wszName, LIMINT uiSeqIndex, LIMINT *piData);
 # LIMFILEAPI LIMRESULT       Lim_GetRecordedDataDouble(LIMFILEHANDLE hFile, LIMCWSTR wszName, LIMINT uiSeqIndex, double* pdData);
 # LIMFILEAPI LIMRESULT       Lim_GetRecordedDataString(LIMFILEHANDLE hFile, LIMCWSTR wszName, LIMINT uiSeqIndex, LIMWSTR wszData);
-# LIMFILEAPI LIMRESULT       Lim_GetNextUserEvent(LIMFILEHANDLE hFile, LIMUINT *puiNextID, LIMFILEUSEREVENT* pEventInfo);
 
 # LIMFILEAPI LIMINT          Lim_GetCustomDataCount(LIMFILEHANDLE hFile);
 # LIMFILEAPI LIMRESULT       Lim_GetCustomDataInfo(LIMFILEHANDLE hFile, LIMINT uiCustomDataIndex, LIMWSTR wszName, LIMWSTR wszDescription, LIMINT *piType, LIMINT *piFlags);
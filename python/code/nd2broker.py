@@ -0,0 +1,362 @@
+""" Shared-memory frame broker for multi-process analysis
+
+FrameBroker runs a single process that reads an ND2 file and decodes frames into a ring of shared memory slots. Worker processes request frames by sequence index through a :class:`FrameClient` and receive read-only NumPy views of the slots, so each frame is decoded once no matter how many workers use it.
+
+Example::
+
+    def work(client):
+        with client.getFrame(0) as frame:
+            process(frame.array)
+
+    with FrameBroker("file.nd2", numClients=4) as broker:
+        workers = [multiprocessing.Process(target=work, args=(broker.client(ii),))
+                   for ii in range(4)]
+
+Slots are reference counted. A slot is only reused after every worker holding it has released the frame. If all slots are in use, requests wait until a slot is released.
+
+If the broker process fails, the error is sent to every client, and waiting clients also check regularly that the broker process is still running, so a failed or killed broker raises an error in the workers instead of blocking them.
+
+"""
+
+from nd2reader import ND2reader, _FrameReader, _npDtype, _registerMemory, _checkMemory
+import nd2trace
+
+from collections import deque, OrderedDict
+from multiprocessing import shared_memory
+import multiprocessing
+import queue
+import time
+import numpy as np
+
+#Interval in seconds at which waiting clients check that the broker is running
+POLL_INTERVAL = 0.5
+
+
+def _brokerMain(filepath, geometry, shmNames, requests, responses, alive):
+    """
+    Entry point of the broker process
+
+    Errors are sent to every client before the process exits. alive is the sending end of a pipe that is never written to. It is closed when the process exits, which lets clients detect a broker that was killed.
+
+    """
+    try:
+        _brokerLoop(filepath, geometry, shmNames, requests, responses)
+    except Exception as err:
+        for response in responses:
+            response.put(("failed", repr(err), None))
+        raise
+
+
+def _brokerLoop(filepath, geometry, shmNames, requests, responses):
+    """ Main loop of the broker process """
+    widthPx, heightPx, bitsPerComponent, numChannels = geometry
+
+    frameReader = _FrameReader(filepath, widthPx, heightPx,
+                               bitsPerComponent, numChannels)
+    shape = frameReader.frame.shape
+    dtype = frameReader.frame.dtype
+
+    shms = [shared_memory.SharedMemory(name=name) for name in shmNames]
+    views = [np.ndarray(shape, dtype, shm.buf) for shm in shms]
+
+    slotOf = {}
+    seqOf = [None] * len(shms)
+    refCount = [0] * len(shms)
+    freeSlots = OrderedDict((iS, None) for iS in range(len(shms)))
+    pending = deque()
+
+    def serve(clientId, seq_index, requestId):
+        slot = slotOf.get(seq_index)
+
+        if slot is None:
+            if not freeSlots:
+                return False
+
+            #Reuse the least recently released slot
+            slot, _ = freeSlots.popitem(last=False)
+            if seqOf[slot] is not None:
+                del slotOf[seqOf[slot]]
+                seqOf[slot] = None
+
+            try:
+                frame, _ = frameReader.read(seq_index)
+            except Exception as err:
+                freeSlots[slot] = None
+                freeSlots.move_to_end(slot, last=False)
+                responses[clientId].put(("error", repr(err), requestId))
+                return True
+
+            views[slot][...] = frame
+            slotOf[seq_index] = slot
+            seqOf[slot] = seq_index
+
+        elif refCount[slot] == 0:
+            del freeSlots[slot]
+
+        refCount[slot] += 1
+        responses[clientId].put(("ok", slot, requestId))
+        return True
+
+    try:
+        while True:
+            message = requests.get()
+
+            if message[0] == "stop":
+                break
+
+            elif message[0] == "get":
+                _, clientId, seq_index, requestId = message
+                if not serve(clientId, seq_index, requestId):
+                    pending.append((clientId, seq_index, requestId))
+
+            elif message[0] == "release":
+                slot = message[1]
+                refCount[slot] -= 1
+                if refCount[slot] == 0:
+                    freeSlots[slot] = None
+
+                while pending and serve(*pending[0]):
+                    pending.popleft()
+    finally:
+        frameReader.close()
+        for shm in shms:
+            shm.close()
+
+
+class SharedFrame:
+    """
+    Frame held in a shared memory slot
+
+    The slot stays reserved until :meth:`release` is called, which happens automatically when the frame is used as a context manager.
+
+    Attributes:
+        seq_index (int): Sequence index of the frame
+        array (np_array): Read-only (height, width, components) view of the slot
+
+    """
+
+    def __init__(self, client, slot, seq_index, array):
+        self._client = client
+        self._slot = slot
+        self.seq_index = seq_index
+        self.array = array
+
+    def release(self):
+        """ Allows the broker to reuse the slot """
+        if self._slot is not None:
+            self._client._release(self._slot)
+            self._slot = None
+            self.array = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class FrameClient:
+    """
+    Connection from a worker process to a :class:`FrameBroker`
+
+    Clients are created with :meth:`FrameBroker.client` and passed to the worker process as an argument when it is started. Each client must only be used by one process and one thread at a time.
+
+    """
+
+    def __init__(self, clientId, requests, response, alive, shmNames, shape, dtype):
+        self._clientId = clientId
+        self._requests = requests
+        self._response = response
+        self._alive = alive
+        self._shmNames = shmNames
+        self._shape = shape
+        self._dtype = dtype
+        self._views = {}
+        self._shms = {}
+        self._requestId = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_views"] = {}
+        state["_shms"] = {}
+        return state
+
+    def _view(self, slot):
+        if slot not in self._views:
+            shm = shared_memory.SharedMemory(name=self._shmNames[slot])
+            view = np.ndarray(self._shape, self._dtype, shm.buf)
+            view.flags.writeable = False
+            self._shms[slot] = shm
+            self._views[slot] = view
+
+        return self._views[slot]
+
+    def getFrame(self, seq_index, timeout=None):
+        """
+        Requests a frame from the broker
+
+        Blocks until the frame has been decoded, or until a slot is released if all slots are in use. Each request carries an ID, so a late reply to a request that timed out is recognized and its slot released instead of being returned. While waiting, the client checks every :data:`POLL_INTERVAL` seconds that the broker process is still running.
+
+        Args:
+            seq_index (uint): Sequence index of frame
+            timeout (float): Maximum time to wait in seconds (default: no limit)
+
+        Returns:
+            frame (:class:`SharedFrame`): Frame in shared memory. Must be released after use.
+
+        Raises:
+            TimeoutError: If the frame is not available within the timeout
+            RuntimeError: If the broker could not read the frame, or the broker process failed or is no longer running
+
+        """
+        self._requestId += 1
+        requestId = self._requestId
+        self._requests.put(("get", self._clientId, int(seq_index), requestId))
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with nd2trace.span("waitFrame", seq_index=int(seq_index)):
+            while True:
+                wait = POLL_INTERVAL
+                if deadline is not None:
+                    wait = min(wait, max(deadline - time.monotonic(), 0))
+
+                try:
+                    status, value, replyId = self._response.get(timeout=wait)
+                except queue.Empty:
+                    #The pipe only becomes readable when the broker has exited
+                    if self._alive.poll():
+                        raise RuntimeError("Broker process is no longer running")
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise TimeoutError("Timed out waiting for frame {}".format(seq_index))
+                    continue
+
+                if status == "failed":
+                    raise RuntimeError("Broker process failed: {}".format(value))
+                if replyId == requestId:
+                    break
+                self._discardReply(status, value)
+
+        if status == "error":
+            raise RuntimeError("Broker failed to read frame {}: {}".format(seq_index, value))
+
+        return SharedFrame(self, value, seq_index, self._view(value))
+
+    def _release(self, slot):
+        self._requests.put(("release", slot))
+
+    def _discardReply(self, status, value):
+        """ Releases the slot of a reply to a request that timed out """
+        if status == "ok":
+            self._release(value)
+
+    def close(self):
+        """ Releases late replies and detaches from the shared memory slots """
+        while True:
+            try:
+                self._discardReply(*self._response.get_nowait()[:2])
+            except queue.Empty:
+                break
+
+        self._views.clear()
+        for shm in self._shms.values():
+            shm.close()
+        self._shms.clear()
+
+
+class FrameBroker:
+    """
+    Broker process serving decoded frames through shared memory
+
+    The shared memory slots are counted in :func:`nd2reader.memory_report` of the process that created the broker.
+
+    """
+
+    #Key under which the slots are counted in nd2reader.memory_report
+    memoryClass = "sharedMemory"
+
+    def __init__(self, pathIn, numClients, numSlots=8, context=None):
+        """
+        Attributes:
+            filepath (Path): Path to the ND2 file
+            numSlots (int): Number of shared memory slots
+            numBytes (int): Size of the shared memory slots in bytes (0 once closed)
+
+        Args:
+            pathIn (str or Path): Path to a valid ND2 file
+            numClients (int): Number of clients (one per worker process)
+            numSlots (int): Number of frames that can be held at once
+            context: multiprocessing context used to start the broker (default: the default context)
+
+        """
+        if numSlots < 1:
+            raise ValueError("numSlots must be at least 1")
+
+        if context is None:
+            context = multiprocessing.get_context()
+
+        with ND2reader(pathIn) as reader:
+            self.filepath = reader.filepath
+            self.numFrames = reader.numFrames
+            geometry = (reader.widthPx, reader.heightPx,
+                        reader.bitsPerComponent, reader.numChannels)
+
+        self.numSlots = numSlots
+        self.frameShape = (geometry[1], geometry[0], geometry[3])
+        self.dtype = np.dtype(_npDtype(geometry[2]))
+
+        frameBytes = int(np.prod(self.frameShape)) * self.dtype.itemsize
+        self._shms = [shared_memory.SharedMemory(create=True, size=frameBytes)
+                      for _ in range(numSlots)]
+        self._shmNames = [shm.name for shm in self._shms]
+        self.numBytes = frameBytes * numSlots
+        _registerMemory(self)
+        _checkMemory()
+
+        self._requests = context.Queue()
+        self._responses = [context.Queue() for _ in range(numClients)]
+        self._alive, aliveSender = context.Pipe(duplex=False)
+
+        self._process = context.Process(target=_brokerMain,
+                                        args=(str(self.filepath), geometry,
+                                              self._shmNames, self._requests,
+                                              self._responses, aliveSender),
+                                        daemon=True)
+        self._process.start()
+
+        #Only the broker keeps the sending end open
+        aliveSender.close()
+
+    def client(self, clientId):
+        """
+        Returns the client with the given id
+
+        Args:
+            clientId (int): 0 <= clientId < numClients
+
+        Returns:
+            client (:class:`FrameClient`)
+
+        """
+        return FrameClient(clientId, self._requests, self._responses[clientId], self._alive,
+                           self._shmNames, self.frameShape, self.dtype)
+
+    def close(self):
+        """ Stops the broker process and frees the shared memory """
+        if self._process is None:
+            return
+
+        self._requests.put(("stop",))
+        self._process.join()
+        self._process = None
+
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+        self.numBytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
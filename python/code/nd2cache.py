@@ -0,0 +1,100 @@
+""" Cache of decoded frames
+
+FrameCache keeps decoded frames in memory up to a size in bytes and drops the least recently used frames first. It is shared by readers that serve the same frames repeatedly, e.g. :class:`nd2server.FrameServer` and :class:`nd2loader.PatchLoader`::
+
+    cache = FrameCache(256 * 2**20)
+
+    frame = cache.get(key)
+    if frame is None:
+        frame = reader.getImage(seq_index)
+        cache.put(key, frame)
+
+The bytes held by all caches are included in :func:`nd2reader.memory_report` and count towards the limit set with :func:`nd2reader.set_memory_limit`.
+
+"""
+
+from nd2reader import _registerMemory, _checkMemory
+
+from collections import OrderedDict
+import threading
+
+
+class FrameCache:
+    """
+    Thread-safe LRU cache of decoded frames bounded by size in bytes
+
+    """
+
+    #Key under which the cache is counted in nd2reader.memory_report
+    memoryClass = "frameCaches"
+
+    def __init__(self, maxBytes):
+        """
+        Attributes:
+            maxBytes (int): Maximum size of the cached frames in bytes
+            numBytes (int): Size of the cached frames in bytes
+
+        Args:
+            maxBytes (int): Maximum size of the cached frames in bytes
+
+        """
+        self.maxBytes = maxBytes
+        self.numBytes = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+        _registerMemory(self)
+
+    def __len__(self):
+        return len(self._frames)
+
+    def get(self, key):
+        """
+        Returns a cached frame
+
+        Args:
+            key: Key the frame was stored under
+
+        Returns:
+            frame (np_array): The frame, or None if it is not cached
+
+        """
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+            return frame
+
+    def put(self, key, frame):
+        """
+        Stores a frame, dropping the least recently used frames if needed
+
+        Frames larger than :attr:`maxBytes` are not stored.
+
+        Args:
+            key: Hashable key, e.g. (file index, sequence index)
+            frame (np_array): Frame to store. It must not be modified afterwards.
+
+        Returns:
+            None
+
+        """
+        if frame.nbytes > self.maxBytes:
+            return
+
+        with self._lock:
+            if key in self._frames:
+                return
+            self._frames[key] = frame
+            self.numBytes += frame.nbytes
+
+            while self.numBytes > self.maxBytes:
+                _, oldFrame = self._frames.popitem(last=False)
+                self.numBytes -= oldFrame.nbytes
+
+        _checkMemory()
+
+    def clear(self):
+        """ Drops all cached frames """
+        with self._lock:
+            self._frames.clear()
+            self.numBytes = 0
@@ -0,0 +1,317 @@
+""" SQLite catalog of the metadata of many ND2 files
+
+The catalog stores the metadata of each file (see :meth:`nd2reader.ND2reader.getInfo`) in a local SQLite database, so that questions about a whole archive (e.g. "which files have 4 channels, a 60x objective and more than 100 time points") can be answered without opening any ND2 file::
+
+    catalog = ND2Catalog("archive.sqlite")
+    catalog.updateDirectory("/data/archive")
+    rows = catalog.query("numChannels = ? AND objectiveMag = ? AND numT > ?", (4, 60, 100))
+
+Files are scanned in parallel in a process pool. The catalog records the size and modification time of each file and only rescans files that have changed since they were last scanned. Files that cannot be read are recorded with an error message and are not retried until they change.
+
+Tables
+------
+
+files
+    One row per file: path, size, mtime_ns, error, the attributes and acquisition metadata returned by getInfo, the loop sizes numT, numP, numZ and numO, and the full getInfo dictionary as JSON (info)
+channels
+    One row per channel: file_id, channelIndex, name, ocName, colorRGB, emissionWL
+loops
+    One row per experiment loop: file_id, level, axis, size, interval
+textinfo
+    One row per non-empty text info field: file_id, key, value
+
+The SDK is only needed to scan files. Opening a catalog and querying it does not load the SDK.
+
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import sqlite3
+import json
+import os
+
+#Columns of the files table filled from ND2reader.getInfo
+INFO_COLUMNS = ["widthPx", "heightPx", "numChannels", "bitsPerComponent", "significantBits",
+                "numFrames", "compression", "quality", "timeStart", "calibration",
+                "objectiveName", "objectiveMag", "objectiveNA", "zoom"]
+
+LOOP_AXES = "TPZO"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    error TEXT,
+    {infoColumns},
+    {loopColumns},
+    info TEXT
+);
+CREATE TABLE IF NOT EXISTS channels (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    channelIndex INTEGER NOT NULL,
+    name TEXT,
+    ocName TEXT,
+    colorRGB INTEGER,
+    emissionWL REAL
+);
+CREATE TABLE IF NOT EXISTS loops (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    level INTEGER NOT NULL,
+    axis TEXT,
+    size INTEGER,
+    interval REAL
+);
+CREATE TABLE IF NOT EXISTS textinfo (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    key TEXT NOT NULL,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS files_numChannels ON files(numChannels);
+CREATE INDEX IF NOT EXISTS files_objectiveMag ON files(objectiveMag);
+CREATE INDEX IF NOT EXISTS files_imageSize ON files(widthPx, heightPx);
+CREATE INDEX IF NOT EXISTS files_numFrames ON files(numFrames);
+CREATE INDEX IF NOT EXISTS files_loops ON files(numT, numP, numZ);
+CREATE INDEX IF NOT EXISTS files_timeStart ON files(timeStart);
+CREATE INDEX IF NOT EXISTS channels_file ON channels(file_id);
+CREATE INDEX IF NOT EXISTS channels_name ON channels(name);
+CREATE INDEX IF NOT EXISTS loops_file ON loops(file_id);
+CREATE INDEX IF NOT EXISTS textinfo_file ON textinfo(file_id);
+CREATE INDEX IF NOT EXISTS textinfo_key ON textinfo(key, value);
+""".format(infoColumns=",\n    ".join(INFO_COLUMNS),
+           loopColumns=",\n    ".join("num" + axis + " INTEGER" for axis in LOOP_AXES))
+
+
+def _scanFile(args):
+    """ Reads the metadata of one file in a worker process """
+    path, size, mtime_ns = args
+
+    try:
+        from nd2reader import ND2reader
+
+        with ND2reader(path, memmap=False) as reader:
+            return path, size, mtime_ns, reader.getInfo(), None
+    except Exception as err:
+        return path, size, mtime_ns, None, repr(err)
+
+
+class ND2Catalog:
+    """
+    SQLite catalog of ND2 file metadata
+
+    """
+
+    def __init__(self, dbPath):
+        """
+        Attributes:
+            dbPath (Path): Path to the SQLite database
+
+        Args:
+            dbPath (str or Path): Path to the SQLite database. It is created if it does not exist.
+
+        """
+        self.dbPath = Path(dbPath)
+        self._conn = sqlite3.connect(str(self.dbPath))
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        """ Closes the database """
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def _stamps(self):
+        return {row["path"]: (row["size"], row["mtime_ns"])
+                for row in self._conn.execute("SELECT path, size, mtime_ns FROM files")}
+
+    def update(self, paths, jobs=None, prune=False, progress=None):
+        """
+        Scans new and changed files
+
+        A file is scanned if it is not in the catalog yet, or if its size or modification time differ from the ones recorded when it was last scanned. Results are committed in batches, so an interrupted update keeps the files scanned so far.
+
+        Args:
+            paths (iterable): Paths to the ND2 files
+            jobs (int): Number of worker processes (default: CPU count)
+            prune (bool): Remove files from the catalog that are not in paths
+            progress (callable): Called as progress(done, total, path) after each scanned file
+
+        Returns:
+            counts (dict): Number of files "scanned", "unchanged", "failed" and "removed"
+
+        """
+        stamps = self._stamps()
+        current = set()
+        todo = []
+        numMissing = 0
+
+        for path in paths:
+            path = str(Path(path).resolve())
+            current.add(path)
+
+            try:
+                stat = os.stat(path)
+            except OSError:
+                numMissing += 1
+                continue
+
+            if stamps.get(path) != (stat.st_size, stat.st_mtime_ns):
+                todo.append((path, stat.st_size, stat.st_mtime_ns))
+
+        counts = {"scanned": 0, "unchanged": len(current) - len(todo) - numMissing, "failed": 0, "removed": 0}
+
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+
+        if jobs <= 1 or len(todo) <= 1:
+            results = map(_scanFile, todo)
+            executor = None
+        else:
+            executor = ProcessPoolExecutor(max_workers=jobs)
+            results = executor.map(_scanFile, todo, chunksize=max(1, min(64, len(todo) // (4 * jobs))))
+
+        try:
+            for done, result in enumerate(results, 1):
+                self._store(*result)
+                counts["scanned"] += 1
+                counts["failed"] += result[4] is not None
+
+                if done % 100 == 0:
+                    self._conn.commit()
+                if progress is not None:
+                    progress(done, len(todo), result[0])
+        finally:
+            self._conn.commit()
+            if executor is not None:
+                executor.shutdown()
+
+        if prune:
+            removed = [path for path in stamps if path not in current]
+            with self._conn:
+                self._conn.executemany("DELETE FROM files WHERE path = ?",
+                                       [(path,) for path in removed])
+            counts["removed"] = len(removed)
+
+        return counts
+
+    def updateDirectory(self, root, pattern="**/*.nd2", prune=True, **kwargs):
+        """
+        Scans the new and changed ND2 files in a directory
+
+        Args:
+            root (str or Path): Directory to search
+            pattern (str): Glob pattern of the files
+            prune (bool): Remove files from the catalog that are no longer in the directory
+            **kwargs: Passed to :meth:`update`
+
+        Returns:
+            counts (dict): See :meth:`update`
+
+        """
+        root = Path(root).resolve()
+        paths = sorted(root.glob(pattern))
+        counts = self.update(paths, prune=False, **kwargs)
+
+        if prune:
+            #Only prune files within the scanned directory
+            current = {str(path.resolve()) for path in paths}
+            prefix = os.path.join(str(root), "")
+            removed = [(path,) for path in self._stamps()
+                       if path not in current and path.startswith(prefix)]
+            with self._conn:
+                self._conn.executemany("DELETE FROM files WHERE path = ?", removed)
+            counts["removed"] = len(removed)
+
+        return counts
+
+    def _store(self, path, size, mtime_ns, info, error):
+        self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+        if info is None:
+            self._conn.execute("INSERT INTO files (path, size, mtime_ns, error) VALUES (?, ?, ?, ?)",
+                               (path, size, mtime_ns, error))
+            return
+
+        loopSizes = {axis: 1 for axis in LOOP_AXES}
+        for loop in info["loops"]:
+            loopSizes[loop["axis"]] = loop["size"]
+
+        columns = ["path", "size", "mtime_ns"] + INFO_COLUMNS + ["num" + axis for axis in LOOP_AXES] + ["info"]
+        values = ([path, size, mtime_ns] + [info[name] for name in INFO_COLUMNS]
+                  + [loopSizes[axis] for axis in LOOP_AXES] + [json.dumps(info)])
+        cursor = self._conn.execute("INSERT INTO files ({}) VALUES ({})".format(
+            ", ".join(columns), ", ".join("?" * len(columns))), values)
+        fileId = cursor.lastrowid
+
+        self._conn.executemany("INSERT INTO channels VALUES (?, ?, ?, ?, ?, ?)",
+                               [(fileId, iC, channel["name"], channel["ocName"],
+                                 channel["colorRGB"], channel["emissionWL"])
+                                for iC, channel in enumerate(info["channels"])])
+        self._conn.executemany("INSERT INTO loops VALUES (?, ?, ?, ?, ?)",
+                               [(fileId, iL, loop["axis"], loop["size"], loop["interval"])
+                                for iL, loop in enumerate(info["loops"])])
+        self._conn.executemany("INSERT INTO textinfo VALUES (?, ?, ?)",
+                               [(fileId, key, value) for key, value in info["textinfo"].items()])
+
+    def query(self, where=None, params=(), includeErrors=False):
+        """
+        Returns the files matching an SQL condition
+
+        Args:
+            where (str): SQL condition on the columns of the files table (e.g. "numChannels = ? AND numT > ?"). Other tables can be used in subqueries, e.g. "id IN (SELECT file_id FROM channels WHERE name = ?)".
+            params (tuple): Values of the ? placeholders in where
+            includeErrors (bool): Include files that could not be read
+
+        Returns:
+            rows (list): One dict per file with the columns of the files table except info, ordered by path
+
+        """
+        conditions = [] if includeErrors else ["error IS NULL"]
+        if where:
+            conditions.append("(" + where + ")")
+
+        sql = "SELECT * FROM files"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+
+        rows = []
+        for row in self._conn.execute(sql + " ORDER BY path", params):
+            row = dict(row)
+            del row["info"]
+            rows.append(row)
+
+        return rows
+
+    def info(self, path):
+        """
+        Returns the stored metadata of a file
+
+        Args:
+            path (str or Path): Path to the ND2 file
+
+        Returns:
+            info (dict): The dictionary returned by :meth:`nd2reader.ND2reader.getInfo` when the file was scanned
+
+        Raises:
+            KeyError: If the file is not in the catalog or could not be read
+
+        """
+        row = self._conn.execute("SELECT info, error FROM files WHERE path = ?",
+                                 (str(Path(path).resolve()),)).fetchone()
+        if row is None:
+            raise KeyError("{} is not in the catalog".format(path))
+        if row["info"] is None:
+            raise KeyError("{} could not be read: {}".format(path, row["error"]))
+
+        return json.loads(row["info"])
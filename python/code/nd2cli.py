@@ -0,0 +1,336 @@
+""" Command-line interface for batch jobs on ND2 files
+
+Usage::
+
+    python nd2cli.py info [--jobs N] FILE [FILE ...]
+    python nd2cli.py convert [--jobs N] [--max-bytes B] [--outdir DIR] [--order AXES [--split]] FILE [FILE ...]
+    python nd2cli.py bench [--jobs N] [--frames N] [--memmap] FILE
+    python nd2cli.py catalog [--jobs N] DATABASE PATH [PATH ...]
+    python nd2cli.py tune [--jobs N] [--memory-limit B] [--save PATH] FILE
+
+info
+    Writes the metadata of each file (see :meth:`nd2reader.ND2reader.getInfo`) to stdout as one JSON object per line. No image data is read.
+
+convert
+    Converts each file to a NumPy .npy file of shape (frames, height, width, components) in sequence order. With --order (e.g. PT), the frames are reorganized into shape (sizes of the axes..., height, width, components), so that e.g. the time series of each position is contiguous, and --split writes one file per coordinate of the outermost axis (see :func:`convertFile`). Files are converted in parallel in a process pool, or a single file with --jobs reading threads. Each worker reads blocks of at most --max-bytes into a reused buffer and writes them into a memory-mapped output file, so memory per worker is bounded.
+
+bench
+    Measures the read latency of single frames and the throughput (frames/s) of sequential reads and of parallel reads with --jobs threads, both decoded by the SDK, or read through the memory map with --memmap (uncompressed files only). The results are written to stdout as JSON.
+
+catalog
+    Adds the metadata of new and changed files to an SQLite catalog (see :mod:`nd2catalog`). Directories are searched recursively for .nd2 files, and files that were removed from them are also removed from the catalog.
+
+tune
+    Calibrates the number of read threads (at most --jobs), the prefetch depth and the cache size for the file within --memory-limit, and writes the chosen settings and the measurements to stdout as JSON (see :func:`nd2tune.calibrate`). With --save, the result is stored in a JSON file for the file type and reused for other files of the same type.
+
+Progress is reported on stderr.
+
+"""
+
+from nd2reader import ND2reader, AXES, _npDtype
+from nd2catalog import ND2Catalog
+import nd2tune
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import argparse
+import json
+import time
+import sys
+import os
+import numpy as np
+
+
+def _progress(done, total, message):
+    print("[{}/{}] {}".format(done, total, message), file=sys.stderr, flush=True)
+
+
+def _mapFiles(func, args, jobs):
+    """ Yields func(arg) for each arg in order, using a process pool if jobs > 1 """
+    if jobs <= 1 or len(args) <= 1:
+        for arg in args:
+            yield func(arg)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for result in executor.map(func, args):
+            yield result
+
+
+def _info(path):
+    try:
+        with ND2reader(path, memmap=False) as reader:
+            return reader.getInfo()
+    except Exception as err:
+        return {"path": str(path), "error": repr(err)}
+
+
+def convertFile(pathIn, pathOut, max_bytes=256 * 2**20, order=None, split=False, numWorkers=1):
+    """
+    Converts an ND2 file to a .npy file with bounded memory
+
+    By default, the frames are written in sequence order, i.e. in the order the microscope acquired them. With order, the frames are reorganized by their loop coordinates, e.g. order="PT" writes the complete time series of each position contiguously, so that per-position jobs can read (or memory-map) their data sequentially. If the acquisition stopped early, the outermost axis only extends to the last coordinate with an acquired frame, and the frames that were not acquired are left as zeros. The output is written in blocks of at most max_bytes in output order, and the frames of each block are read in file order by numWorkers threads.
+
+    Args:
+        pathIn (str or Path): Path to the ND2 file
+        pathOut (str or Path): Path to the .npy file to write
+        max_bytes (int): Maximum size of the read buffer in bytes
+        order (str): Axes of the output, outermost first, using the letters T (time), P (multipoint), Z and O (other). Every axis with more than one coordinate must be included. The output has shape (sizes of the axes in order..., height, width, components). Default: shape (frames, height, width, components) in sequence order.
+        split (bool): Write one file per coordinate of the outermost axis of order instead, named <stem>_<axis><index>.npy next to pathOut
+        numWorkers (int): Number of threads reading each block
+
+    Returns:
+        numFrames (int): Number of frames written (the frames of the file, not counting zero-filled frames)
+
+    Raises:
+        ValueError: If order leaves out an axis with more than one coordinate, or split is given without order
+
+    """
+    pathOut = Path(pathOut)
+
+    with ND2reader(pathIn) as reader:
+        dtype = np.dtype(_npDtype(reader.bitsPerComponent))
+        frameShape = (reader.heightPx, reader.widthPx, reader.numChannels)
+        frameBytes = int(np.prod(frameShape)) * dtype.itemsize
+
+        if order is None:
+            if split:
+                raise ValueError("split requires an axis order")
+
+            outShape = (reader.numFrames,)
+            chunkSize = int(max(1, min(max_bytes // frameBytes, reader.numFrames)))
+            buffer = np.empty((chunkSize,) + frameShape, dtype)
+
+            def readBlocks():
+                #The worker handles are kept open for all blocks
+                pool = reader._openReaderPool(numWorkers)
+                try:
+                    for start in range(0, reader.numFrames, chunkSize):
+                        positions = np.arange(start, min(start + chunkSize, reader.numFrames))
+                        yield (reader._readInto(buffer[:len(positions)], positions,
+                                                numWorkers=numWorkers, pool=pool),
+                               positions)
+                finally:
+                    if pool is not None:
+                        pool.close()
+
+            blocks = readBlocks()
+        else:
+            order = order.upper()
+            sizes = reader.loopSizes
+            missing = [axis for axis, size in zip(AXES, sizes) if size > 1 and axis not in order]
+            if missing:
+                raise ValueError("Axes {} have more than one coordinate and must be in order".format(
+                    "".join(missing)))
+
+            axisNums = [AXES.index(axis) for axis in order]
+            outShape = tuple(sizes[axisNum] for axisNum in axisNums)
+
+            #Clip the outermost axis to the frames that have been acquired
+            coords = reader._selectCoords(order)
+            acquired = coords[reader._seqIndices(coords) < reader.numFrames]
+            outShape = (int(acquired[:, axisNums[0]].max()) + 1 if len(acquired) else 0,) + outShape[1:]
+
+            #iter_chunks leaves out frames that have not been acquired, so each
+            #frame is written at the position of its coordinates
+            blocks = ((block, np.ravel_multi_index(tuple(coords[:, axisNums].T), outShape))
+                      for block, coords in reader.iter_chunks(order, max_bytes,
+                                                              numWorkers=numWorkers))
+
+        if split:
+            paths = [pathOut.with_name("{}_{}{}.npy".format(pathOut.stem, order[0], index))
+                     for index in range(outShape[0])]
+            fileShape = outShape[1:]
+        else:
+            paths = [pathOut]
+            fileShape = outShape
+
+        tmpPaths = [Path(str(path) + ".tmp") for path in paths]
+        outputs = []
+        flatOutputs = []
+
+        try:
+            try:
+                for tmpPath in tmpPaths:
+                    outputs.append(np.lib.format.open_memmap(str(tmpPath), mode="w+", dtype=dtype,
+                                                             shape=fileShape + frameShape))
+
+                #Flat (frames, ...) views of the outputs
+                flatOutputs.extend(out.reshape((-1,) + frameShape) for out in outputs)
+                framesPerFile = int(np.prod(fileShape))
+
+                numWritten = 0
+                for block, positions in blocks:
+                    for frame, position in zip(block, positions.tolist()):
+                        fileIndex, offset = divmod(position, framesPerFile)
+                        flatOutputs[fileIndex][offset] = frame
+                    numWritten += len(block)
+
+                for out in outputs:
+                    out.flush()
+            finally:
+                #Drop every reference to the memory maps, since a mapped file
+                #cannot be renamed or removed on Windows
+                out = None
+                flatOutputs.clear()
+                outputs.clear()
+
+            for tmpPath, path in zip(tmpPaths, paths):
+                os.replace(str(tmpPath), str(path))
+        except BaseException:
+            for tmpPath in tmpPaths:
+                if tmpPath.exists():
+                    tmpPath.unlink()
+            raise
+
+        return numWritten
+
+
+def _convert(args):
+    pathIn, pathOut, kwargs = args
+    start = time.perf_counter()
+
+    try:
+        numFrames = convertFile(pathIn, pathOut, **kwargs)
+    except Exception as err:
+        return pathIn, None, repr(err)
+
+    return pathIn, numFrames, time.perf_counter() - start
+
+
+def benchmark(pathIn, numFrames=100, jobs=1, memmap=False):
+    """
+    Measures read latency and throughput
+
+    The sequential test reads single frames with :meth:`nd2reader.ND2reader.getImage` and the parallel test reads the same frames with :meth:`nd2reader.ND2reader.getImages`, so both tests decode and copy every frame through the same backend.
+
+    Args:
+        pathIn (str or Path): Path to the ND2 file
+        numFrames (int): Maximum number of frames to read in each test
+        jobs (int): Number of threads for the parallel test
+        memmap (bool): Read uncompressed files through the memory map instead of the SDK (see :class:`nd2reader.ND2reader`)
+
+    Returns:
+        results (dict): Latency percentiles in milliseconds and frames/s for sequential and parallel reads
+
+    """
+    with ND2reader(pathIn, memmap=memmap) as reader:
+        seqIndices = np.arange(min(numFrames, reader.numFrames))
+
+        latencies = np.empty(len(seqIndices))
+        start = time.perf_counter()
+        for ii, seq_index in enumerate(seqIndices):
+            frameStart = time.perf_counter()
+            reader.getImage(int(seq_index))
+            latencies[ii] = time.perf_counter() - frameStart
+        sequentialTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        reader.getImages(seqIndices, numWorkers=jobs)
+        parallelTime = time.perf_counter() - start
+
+        return {"path": str(reader.filepath),
+                "frames": len(seqIndices),
+                "frameBytes": reader.heightPx * reader.widthPx * reader.numChannels
+                              * np.dtype(_npDtype(reader.bitsPerComponent)).itemsize,
+                "latencyMs": {"mean": 1e3 * float(latencies.mean()),
+                              "p50": 1e3 * float(np.percentile(latencies, 50)),
+                              "p95": 1e3 * float(np.percentile(latencies, 95)),
+                              "max": 1e3 * float(latencies.max())},
+                "sequentialFps": len(seqIndices) / sequentialTime,
+                "parallelFps": len(seqIndices) / parallelTime,
+                "jobs": jobs,
+                "memmap": reader.usesMemmap}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="nd2", description="Batch tools for ND2 files")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1,
+                        help="Number of parallel workers (default: CPU count)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    infoParser = subparsers.add_parser("info", help="Dump metadata as JSON lines")
+    infoParser.add_argument("files", nargs="+")
+
+    convertParser = subparsers.add_parser("convert", help="Convert files to .npy")
+    convertParser.add_argument("files", nargs="+")
+    convertParser.add_argument("--outdir", default=None,
+                               help="Output directory (default: next to each file)")
+    convertParser.add_argument("--max-bytes", type=int, default=256 * 2**20,
+                               help="Read buffer size per worker in bytes")
+    convertParser.add_argument("--order", default=None,
+                               help="Axis order of the output, e.g. PT for contiguous time series per position (default: sequence order)")
+    convertParser.add_argument("--split", action="store_true",
+                               help="Write one file per coordinate of the outermost axis of --order")
+
+    benchParser = subparsers.add_parser("bench", help="Measure read performance")
+    benchParser.add_argument("file")
+    benchParser.add_argument("--frames", type=int, default=100,
+                             help="Maximum number of frames to read")
+    benchParser.add_argument("--memmap", action="store_true",
+                             help="Read uncompressed files through the memory map instead of the SDK")
+
+    catalogParser = subparsers.add_parser("catalog", help="Update an SQLite metadata catalog")
+    catalogParser.add_argument("database")
+    catalogParser.add_argument("paths", nargs="+", help="ND2 files or directories")
+
+    tuneParser = subparsers.add_parser("tune", help="Calibrate read settings")
+    tuneParser.add_argument("file")
+    tuneParser.add_argument("--memory-limit", type=int, default=None,
+                            help="Memory available for reading in bytes")
+    tuneParser.add_argument("--save", default=None,
+                            help="JSON file to store and reuse the settings per file type")
+
+    args = parser.parse_args(argv)
+    numFailed = 0
+
+    if args.command == "info":
+        for done, info in enumerate(_mapFiles(_info, args.files, args.jobs), 1):
+            print(json.dumps(info), flush=True)
+            numFailed += "error" in info
+            _progress(done, len(args.files), info["path"])
+
+    elif args.command == "convert":
+        #A single file is read with parallel threads instead of processes
+        kwargs = {"max_bytes": args.max_bytes, "order": args.order, "split": args.split,
+                  "numWorkers": args.jobs if len(args.files) == 1 else 1}
+
+        jobs = []
+        for pathIn in args.files:
+            outdir = Path(args.outdir) if args.outdir else Path(pathIn).parent
+            jobs.append((pathIn, str(outdir / (Path(pathIn).stem + ".npy")), kwargs))
+
+        for done, (pathIn, numFrames, result) in enumerate(_mapFiles(_convert, jobs, args.jobs), 1):
+            if numFrames is None:
+                numFailed += 1
+                _progress(done, len(jobs), "{} failed: {}".format(pathIn, result))
+            else:
+                _progress(done, len(jobs), "{} ({} frames, {:.1f} frames/s)".format(
+                    pathIn, numFrames, numFrames / max(result, 1e-9)))
+
+    elif args.command == "bench":
+        print(json.dumps(benchmark(args.file, args.frames, args.jobs, args.memmap)))
+
+    elif args.command == "catalog":
+        with ND2Catalog(args.database) as catalog:
+            files = [path for path in args.paths if not Path(path).is_dir()]
+            counts = catalog.update(files, jobs=args.jobs, progress=_progress)
+
+            for root in [path for path in args.paths if Path(path).is_dir()]:
+                dirCounts = catalog.updateDirectory(root, jobs=args.jobs, progress=_progress)
+                for key in counts:
+                    counts[key] += dirCounts[key]
+
+        print(json.dumps(counts))
+        numFailed = counts["failed"]
+
+    elif args.command == "tune":
+        with ND2reader(args.file) as reader:
+            result = nd2tune.autotune(reader, args.memory_limit, args.save, maxWorkers=args.jobs)
+        print(json.dumps(result))
+
+    return 1 if numFailed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
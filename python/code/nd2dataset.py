@@ -0,0 +1,255 @@
+""" Collections of ND2 files
+
+ND2Dataset presents many ND2 files (e.g. one per well or per day) as a single indexed collection of frames. Only a bounded number of files are kept open at any time, so the number of SDK handles and picture buffers does not grow with the size of the collection.
+
+"""
+
+from nd2reader import ND2reader
+
+from pathlib import Path
+from collections import OrderedDict
+import threading
+import numpy as np
+
+
+class ND2Dataset:
+    """
+    Class to read a collection of ND2 files
+
+    Files are opened on first access and kept in a least-recently-used pool. When the pool is full, the file that has not been used for the longest time is closed. The global frame index, which maps a dataset-wide frame number to a (file, sequence index) pair, is only built when it is first needed.
+
+    """
+
+    def __init__(self, paths, maxOpen=8):
+        """
+        Attributes:
+            paths (list): Paths to the ND2 files in the dataset
+            maxOpen (int): Maximum number of files kept open
+
+        Args:
+            paths (iterable): Paths (str or Path) to the ND2 files
+            maxOpen (int): Maximum number of files kept open at once
+
+        """
+        if maxOpen < 1:
+            raise ValueError("maxOpen must be at least 1")
+
+        self.paths = [Path(path) for path in paths]
+        self.maxOpen = maxOpen
+
+        self._pool = OrderedDict()
+        self._poolLock = threading.Lock()
+        self._frameCounts = [None] * len(self.paths)
+        self._offsets = None
+
+    @classmethod
+    def fromDirectory(cls, root, pattern="*.nd2", **kwargs):
+        """
+        Creates a dataset from the ND2 files in a directory
+
+        Args:
+            root (str or Path): Directory to search
+            pattern (str): Glob pattern of the files (use "**/*.nd2" to include subdirectories)
+            **kwargs: Passed to :class:`ND2Dataset`
+
+        Returns:
+            dataset (:class:`ND2Dataset`)
+
+        """
+        return cls(sorted(Path(root).glob(pattern)), **kwargs)
+
+    def __len__(self):
+        return int(self._frameOffsets()[-1])
+
+    def __getitem__(self, index):
+        return self.getImage(*self.locate(index))
+
+    def close(self):
+        """ Closes all open files """
+        with self._poolLock:
+            entries = list(self._pool.values())
+            self._pool.clear()
+
+        for entry in entries:
+            self._closeEntry(entry)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def numOpen(self):
+        """ Number of files currently open """
+        return len(self._pool)
+
+    def _closeEntry(self, entry):
+        #Wait for any read or open in progress before closing
+        with entry[1]:
+            if entry[0] is not None:
+                entry[0].close()
+
+    def _acquire(self, fileIndex):
+        """
+        Returns the pool entry of a file, opening the file if necessary
+
+        The returned lock is held by the caller. An evicted file is only closed after its lock is released, so eviction never closes a file that is being read. If the file was evicted and closed between the lookup and taking its lock, it is opened again.
+
+        A file is opened outside the pool lock, so threads reading other files are not held up by it. While it is being opened, its entry holds no reader yet and its lock is held by the opening thread, so other threads asking for the same file wait for the open to finish.
+
+        """
+        while True:
+            evicted = []
+            opening = False
+
+            with self._poolLock:
+                entry = self._pool.get(fileIndex)
+
+                if entry is None:
+                    #Placeholder, published with its lock held until the file is open
+                    entry = [None, threading.Lock()]
+                    entry[1].acquire()
+                    self._pool[fileIndex] = entry
+                    opening = True
+
+                    while len(self._pool) > self.maxOpen:
+                        evicted.append(self._pool.popitem(last=False)[1])
+                else:
+                    self._pool.move_to_end(fileIndex)
+
+            for oldEntry in evicted:
+                self._closeEntry(oldEntry)
+
+            if opening:
+                try:
+                    entry[0] = ND2reader(self.paths[fileIndex])
+                except BaseException:
+                    with self._poolLock:
+                        if self._pool.get(fileIndex) is entry:
+                            del self._pool[fileIndex]
+                    entry[1].release()
+                    raise
+
+                self._frameCounts[fileIndex] = entry[0].numFrames
+                return entry
+
+            entry[1].acquire()
+            if entry[0] is not None and not entry[0].closed:
+                return entry
+
+            #Evicted by another thread before the lock was taken, or the open failed
+            entry[1].release()
+
+    def numFrames(self, fileIndex):
+        """
+        Returns the number of frames in a file
+
+        Args:
+            fileIndex (int): Index of the file in :attr:`paths`
+
+        Returns:
+            numFrames (int)
+
+        """
+        if self._frameCounts[fileIndex] is None:
+            reader, lock = self._acquire(fileIndex)
+            lock.release()
+
+        return self._frameCounts[fileIndex]
+
+    def _frameOffsets(self):
+        """ Returns the cumulative frame counts, opening unseen files once """
+        if self._offsets is None:
+            counts = [self.numFrames(iF) for iF in range(len(self.paths))]
+            self._offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+        return self._offsets
+
+    def locate(self, index):
+        """
+        Converts a dataset-wide frame index into a file and sequence index
+
+        Args:
+            index (int): Frame index in the dataset (negative values count from the end)
+
+        Returns:
+            fileIndex (int): Index of the file in :attr:`paths`
+            seq_index (int): Sequence index of the frame in that file
+
+        Raises:
+            IndexError: If the index is out of range
+
+        """
+        offsets = self._frameOffsets()
+
+        if index < 0:
+            index += offsets[-1]
+        if index < 0 or index >= offsets[-1]:
+            raise IndexError("Frame index {} out of range ({} frames)".format(index, offsets[-1]))
+
+        fileIndex = int(np.searchsorted(offsets, index, side="right")) - 1
+
+        return fileIndex, int(index - offsets[fileIndex])
+
+    def info(self, fileIndex):
+        """
+        Returns the image attributes of a file
+
+        Args:
+            fileIndex (int): Index of the file in :attr:`paths`
+
+        Returns:
+            info (dict): Path, frame count and image geometry of the file
+
+        """
+        reader, lock = self._acquire(fileIndex)
+        try:
+            return {"path": str(reader.filepath),
+                    "numFrames": reader.numFrames,
+                    "widthPx": reader.widthPx,
+                    "heightPx": reader.heightPx,
+                    "numChannels": reader.numChannels,
+                    "bitsPerComponent": reader.bitsPerComponent,
+                    "significantBits": reader.significantBits}
+        finally:
+            lock.release()
+
+    def getImage(self, fileIndex, *index, **kwargs):
+        """
+        Returns an image from one of the files as a numpy ndarray
+
+        Args:
+            fileIndex (int): Index of the file in :attr:`paths`
+            *index (uint): Either image coordinates or index (see :meth:`nd2reader.ND2reader.getImage`)
+            **kwargs: dtype and normalize (see :meth:`nd2reader.ND2reader.getImage`)
+
+        Returns:
+            np_array: A numpy ND array containing the image
+
+        """
+        reader, lock = self._acquire(fileIndex)
+        try:
+            return reader.getImage(*index, **kwargs)
+        finally:
+            lock.release()
+
+    def getROI(self, fileIndex, roi, *index, **kwargs):
+        """
+        Returns a rectangular region of an image from one of the files
+
+        Args:
+            fileIndex (int): Index of the file in :attr:`paths`
+            roi (tuple): (y0, y1, x0, x1) pixel bounds of the region
+            *index (uint): Either image coordinates or index
+            **kwargs: dtype and normalize (see :meth:`nd2reader.ND2reader.getImage`)
+
+        Returns:
+            np_array: A numpy ND array containing the region
+
+        """
+        reader, lock = self._acquire(fileIndex)
+        try:
+            return reader.getROI(roi, *index, **kwargs)
+        finally:
+            lock.release()
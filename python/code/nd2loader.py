@@ -0,0 +1,292 @@
+""" Shuffled patch sampling for training on ND2 files
+
+PatchLoader draws random fixed-size patches from the frames of a set of ND2 files and returns them in batches, e.g. to train a segmentation model directly on acquisitions::
+
+    loader = PatchLoader(paths, patchSize=256, batchSize=32, framesPerBatch=4, seed=1)
+    for epoch in range(numEpochs):
+        for patches, samples in loader:
+            ...
+
+Each epoch visits the frames of the files in a shuffled order. Every batch takes its patches from framesPerBatch frames, so each frame is read at most once per batch. When the patches taken from a frame lie within a small part of it, only the bounding box of the patches is read, as a single region (see :meth:`nd2reader.ND2reader.getROI`). Otherwise the whole frame is decoded and kept in a cache bounded by size in bytes, so that later batches can reuse it.
+
+Batches are read by numWorkers threads. If the loader opens the files itself, each thread that reads at the same time gets its own :class:`nd2dataset.ND2Dataset`, and so its own file handles, so the threads can read the same file in parallel. A dataset passed to the loader is shared by all threads, and reads of the same file then take turns.
+
+The random order and patch positions depend only on the seed, the epoch and the shard, so the batches can be reproduced exactly. To split the work across worker processes, create one loader per process with the same seed and a different shardIndex. Each shard gets a disjoint part of the frames of each epoch.
+
+"""
+
+from nd2dataset import ND2Dataset
+from nd2reader import _npDtype
+from nd2cache import FrameCache
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import threading
+import numpy as np
+
+#Location of each patch in a batch
+SAMPLE_DTYPE = np.dtype([("fileIndex", np.int32), ("seq_index", np.int64),
+                         ("y", np.int32), ("x", np.int32)])
+
+
+class PatchLoader:
+    """
+    Loader of shuffled random patches from a set of ND2 files
+
+    """
+
+    def __init__(self, paths, patchSize=256, batchSize=32, framesPerBatch=4, seed=0,
+                 shardIndex=0, numShards=1, cacheBytes=256 * 2**20, roiFraction=0.25,
+                 numWorkers=1, prefetch=2, dtype=None, normalize=None, maxOpen=8):
+        """
+        Attributes:
+            dataset (:class:`nd2dataset.ND2Dataset`): Files patches are drawn from
+            patchSize (tuple): (height, width) of the patches
+            epoch (int): Epoch used by the next iteration. It is incremented after each complete iteration.
+
+        Args:
+            paths (iterable or :class:`nd2dataset.ND2Dataset`): Paths to the ND2 files, or an open dataset
+            patchSize (int or tuple): Size of the patches in pixels, either a single value or (height, width)
+            batchSize (int): Number of patches per batch
+            framesPerBatch (int): Number of frames the patches of a batch are taken from
+            seed (int): Seed of the random order and patch positions
+            shardIndex (int): Index of the shard of this loader
+            numShards (int): Total number of shards
+            cacheBytes (int): Size of the decoded-frame cache in bytes
+            roiFraction (float): Only the bounding box of the patches taken from a frame is read if it covers less than this fraction of the frame
+            numWorkers (int): Number of threads reading batches
+            prefetch (int): Number of batches read ahead
+            dtype: Data type of the patches (see :meth:`nd2reader.ND2reader.getImage`)
+            normalize (str or tuple): Intensity normalization (see :meth:`nd2reader.ND2reader.getImage`)
+            maxOpen (int): Maximum number of files kept open by each reading thread (if paths are given)
+
+        Raises:
+            ValueError: If the arguments are invalid
+
+        """
+        if isinstance(patchSize, int):
+            patchSize = (patchSize, patchSize)
+        if not 0 <= shardIndex < numShards:
+            raise ValueError("shardIndex must be in [0, numShards)")
+        if batchSize < 1 or not 1 <= framesPerBatch <= batchSize:
+            raise ValueError("framesPerBatch must be between 1 and batchSize")
+
+        if isinstance(paths, ND2Dataset):
+            self.dataset = paths
+            self._ownsDataset = False
+        else:
+            self.dataset = ND2Dataset(paths, maxOpen=maxOpen)
+            self._ownsDataset = True
+
+        self.patchSize = tuple(int(val) for val in patchSize)
+        self.batchSize = batchSize
+        self.framesPerBatch = framesPerBatch
+        self.seed = seed
+        self.shardIndex = shardIndex
+        self.numShards = numShards
+        self.roiFraction = roiFraction
+        self.numWorkers = numWorkers
+        self.prefetch = max(prefetch, 1)
+        self.epoch = 0
+
+        self._readArgs = {"dtype": dtype, "normalize": normalize}
+        self._cache = FrameCache(cacheBytes)
+        self._idleDatasets = [self.dataset]
+        self._datasetLock = threading.Lock()
+        self._frames = None
+        self._patchShape = None
+        self._patchDtype = None
+
+    def close(self):
+        """ Closes the files (if the loader opened them) """
+        if self._ownsDataset:
+            with self._datasetLock:
+                datasets = self._idleDatasets
+                self._idleDatasets = [self.dataset]
+            for dataset in datasets:
+                dataset.close()
+
+    def _borrowDataset(self):
+        """ Returns a dataset that the calling thread reads from alone (if the loader opened the files) """
+        if not self._ownsDataset:
+            return self.dataset
+
+        with self._datasetLock:
+            if self._idleDatasets:
+                return self._idleDatasets.pop()
+
+        return ND2Dataset(self.dataset.paths, maxOpen=self.dataset.maxOpen)
+
+    def _returnDataset(self, dataset):
+        if self._ownsDataset:
+            with self._datasetLock:
+                self._idleDatasets.append(dataset)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _eligibleFrames(self):
+        """
+        Lists the frames that are large enough for a patch
+
+        Returns:
+            frames (np_array): (n, 2) file and sequence index of each frame
+
+        """
+        if self._frames is not None:
+            return self._frames
+
+        height, width = self.patchSize
+        frames = []
+        geometry = {}
+
+        for fileIndex in range(len(self.dataset.paths)):
+            info = self.dataset.info(fileIndex)
+            if info["heightPx"] < height or info["widthPx"] < width:
+                continue
+
+            geometry[fileIndex] = (info["heightPx"], info["widthPx"])
+            frames.append(np.stack([np.full(info["numFrames"], fileIndex),
+                                    np.arange(info["numFrames"])], axis=1))
+
+            if self._patchShape is None:
+                dtype, normalize = self._readArgs["dtype"], self._readArgs["normalize"]
+                if dtype is None:
+                    dtype = np.float32 if normalize is not None else _npDtype(info["bitsPerComponent"])
+                self._patchShape = self.patchSize + (info["numChannels"],)
+                self._patchDtype = np.dtype(dtype)
+            elif (info["numChannels"] != self._patchShape[2]
+                  or (self._readArgs["dtype"] is None and self._readArgs["normalize"] is None
+                      and np.dtype(_npDtype(info["bitsPerComponent"])) != self._patchDtype)):
+                raise ValueError("{} has a different number of channels or bit depth; "
+                                 "set dtype to combine files".format(info["path"]))
+
+        if not frames:
+            raise ValueError("No frame is large enough for a {}x{} patch".format(height, width))
+
+        self._geometry = geometry
+        self._frames = np.concatenate(frames).astype(np.int64)
+
+        return self._frames
+
+    def _plan(self, epoch):
+        """ Returns the frames of each batch of this shard in an epoch """
+        frames = self._eligibleFrames()
+        order = np.random.RandomState([self.seed, epoch]).permutation(len(frames))
+        order = order[self.shardIndex::self.numShards]
+
+        return [order[start:start + self.framesPerBatch]
+                for start in range(0, len(order), self.framesPerBatch)]
+
+    def __len__(self):
+        """ Number of batches per epoch in this shard """
+        return len(self._plan(self.epoch))
+
+    def getBatch(self, batchIndex, epoch=None):
+        """
+        Reads one batch
+
+        Batches can be read in any order and from several threads.
+
+        Args:
+            batchIndex (int): Index of the batch in the epoch
+            epoch (int): Epoch (default: :attr:`epoch`)
+
+        Returns:
+            patches (np_array): (batchSize, height, width, components) patches
+            samples (np_array): File index, sequence index and top left corner (y, x) of each patch (see :data:`SAMPLE_DTYPE`)
+
+        """
+        if epoch is None:
+            epoch = self.epoch
+
+        return self._readBatch(epoch, batchIndex, self._plan(epoch)[batchIndex])
+
+    def _readBatch(self, epoch, batchIndex, frameIds):
+        dataset = self._borrowDataset()
+        try:
+            return self._readPatches(dataset, epoch, batchIndex, frameIds)
+        finally:
+            self._returnDataset(dataset)
+
+    def _readPatches(self, dataset, epoch, batchIndex, frameIds):
+        rng = np.random.RandomState([self.seed, epoch, self.shardIndex, batchIndex])
+        height, width = self.patchSize
+
+        patches = np.empty((self.batchSize,) + self._patchShape, self._patchDtype)
+        samples = np.empty(self.batchSize, SAMPLE_DTYPE)
+
+        #Patches are written to shuffled positions, so the batch does not
+        #need to be permuted afterwards
+        targets = rng.permutation(self.batchSize)
+        counts = np.full(len(frameIds), self.batchSize // len(frameIds))
+        counts[:self.batchSize % len(frameIds)] += 1
+
+        position = 0
+        for frameId, count in zip(frameIds, counts):
+            fileIndex, seq_index = (int(val) for val in self._frames[frameId])
+            frameHeight, frameWidth = self._geometry[fileIndex]
+            ys = rng.randint(0, frameHeight - height + 1, count)
+            xs = rng.randint(0, frameWidth - width + 1, count)
+
+            key = (fileIndex, seq_index)
+            frame = self._cache.get(key)
+            y0, x0 = 0, 0
+
+            if frame is None:
+                #Bounding box of the patches
+                box = (int(ys.min()), int(ys.max()) + height, int(xs.min()), int(xs.max()) + width)
+
+                if (box[1] - box[0]) * (box[3] - box[2]) < self.roiFraction * frameHeight * frameWidth:
+                    frame = dataset.getROI(fileIndex, box, seq_index, **self._readArgs)
+                    y0, x0 = box[0], box[2]
+                else:
+                    frame = dataset.getImage(fileIndex, seq_index, **self._readArgs)
+                    self._cache.put(key, frame)
+
+            for y, x in zip(ys.tolist(), xs.tolist()):
+                target = targets[position]
+                patches[target] = frame[y - y0:y - y0 + height, x - x0:x - x0 + width]
+
+                samples[target] = (fileIndex, seq_index, y, x)
+                position += 1
+
+        return patches, samples
+
+    def __iter__(self):
+        """
+        Iterates over the batches of the current epoch
+
+        Batches are read ahead by background threads. :attr:`epoch` is incremented when the iteration completes.
+
+        Yields:
+            patches (np_array): See :meth:`getBatch`
+            samples (np_array): See :meth:`getBatch`
+
+        """
+        epoch = self.epoch
+        plan = self._plan(epoch)
+        executor = ThreadPoolExecutor(max(self.numWorkers, 1))
+        pending = deque()
+
+        try:
+            for batchIndex in range(min(self.prefetch, len(plan))):
+                pending.append(executor.submit(self._readBatch, epoch, batchIndex, plan[batchIndex]))
+
+            for batchIndex in range(len(plan)):
+                batch = pending.popleft().result()
+
+                nextIndex = batchIndex + self.prefetch
+                if nextIndex < len(plan):
+                    pending.append(executor.submit(self._readBatch, epoch, nextIndex, plan[nextIndex]))
+
+                yield batch
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+        self.epoch = epoch + 1
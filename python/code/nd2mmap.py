@@ -0,0 +1,274 @@
+""" Memory-mapped access to uncompressed ND2 files
+
+For ND2 files stored without compression (LIMATTRIBUTES.uiCompression == 2), the pixel data of each frame is stored as-is in the file. This module parses the chunk map of such files once and returns frames as zero-copy, read-only views of a np.memmap of the file. It does not use the ND2 SDK, so it can also be used on hosts where the SDK library is not available.
+
+Only version 3 ND2 files (with a chunk map at the end of the file) are supported. Any file that is not recognized raises :class:`UnsupportedFileError`, in which case the SDK should be used instead. :class:`nd2reader.ND2reader` does this automatically.
+
+File layout
+-----------
+
+Every chunk starts with a 16-byte header (uint32 magic 0x0ABECEDA, uint32 name length, uint64 data length) followed by the name and the data. The last 40 bytes of the file hold the chunk map signature and the uint64 offset of the chunk map. The chunk map lists the name, offset and size of every chunk. Frame i is stored in the chunk "ImageDataSeq|i!" as an 8-byte timestamp followed by the rows of the image. Image attributes are stored in the "ImageAttributesLV!" chunk in a binary key-value format.
+
+"""
+
+from pathlib import Path
+import struct
+import numpy as np
+
+CHUNK_MAGIC = 0x0ABECEDA
+CHUNK_MAP_SIGNATURE = b"ND2 CHUNK MAP SIGNATURE 0000001!"
+FILEMAP_NAME = b"ND2 FILEMAP SIGNATURE NAME 0001!"
+COMPRESSION_NONE = 2
+
+_CHUNK_HEADER = struct.Struct("<IIQ")
+
+
+class UnsupportedFileError(ValueError):
+    """ Raised if a file cannot be read without the SDK """
+
+
+def _readChunkHeader(data, position):
+    if position + _CHUNK_HEADER.size > len(data):
+        raise UnsupportedFileError("Chunk header at {} is outside the file".format(position))
+
+    magic, nameLength, dataLength = _CHUNK_HEADER.unpack_from(data, position)
+    if magic != CHUNK_MAGIC:
+        raise UnsupportedFileError("No chunk at {}".format(position))
+
+    return nameLength, dataLength
+
+
+def readChunkMap(data):
+    """
+    Parses the chunk map of an ND2 file
+
+    Args:
+        data (buffer): Contents of the file (e.g. a np.memmap)
+
+    Returns:
+        chunks (dict): (offset, size) of each chunk keyed by chunk name (bytes)
+
+    Raises:
+        UnsupportedFileError: If the file has no valid chunk map
+
+    """
+    size = len(data)
+    if size < 40 or bytes(data[-40:-8]) != CHUNK_MAP_SIGNATURE:
+        raise UnsupportedFileError("No chunk map signature (not a version 3 ND2 file)")
+
+    mapOffset = struct.unpack_from("<Q", data, size - 8)[0]
+    nameLength, dataLength = _readChunkHeader(data, mapOffset)
+    start = mapOffset + _CHUNK_HEADER.size + nameLength
+    mapData = bytes(data[start:start + dataLength])
+
+    chunks = {}
+    position = 0
+    while True:
+        end = mapData.find(b"!", position)
+        if end < 0:
+            raise UnsupportedFileError("Chunk map is truncated")
+
+        name = mapData[position:end + 1]
+        if name == CHUNK_MAP_SIGNATURE:
+            break
+        if end + 17 > len(mapData):
+            raise UnsupportedFileError("Chunk map is truncated")
+
+        chunks[name] = struct.unpack_from("<QQ", mapData, end + 1)
+        position = end + 17
+
+    return chunks
+
+
+def _readString(data, position):
+    end = position
+    while data[end:end + 2] != b"\x00\x00":
+        end += 2
+        if end >= len(data):
+            raise UnsupportedFileError("Unterminated string")
+
+    return data[position:end].decode("utf-16-le"), end + 2
+
+
+_SCALARS = {1: struct.Struct("<?"), 2: struct.Struct("<i"), 3: struct.Struct("<I"),
+            4: struct.Struct("<q"), 5: struct.Struct("<Q"), 6: struct.Struct("<d"),
+            7: struct.Struct("<Q")}
+
+
+def _readVariant(data, position, count=None):
+    """ Parses items of the binary key-value format into a dictionary """
+    result = {}
+
+    while position < len(data) and (count is None or len(result) < count):
+        itemType, nameLength = struct.unpack_from("<BB", data, position)
+        position += 2
+        name = data[position:position + 2 * nameLength].decode("utf-16-le").rstrip("\x00")
+        position += 2 * nameLength
+
+        if itemType in _SCALARS:
+            value = _SCALARS[itemType].unpack_from(data, position)[0]
+            position += _SCALARS[itemType].size
+        elif itemType == 8:
+            value, position = _readString(data, position)
+        elif itemType == 9:
+            length = struct.unpack_from("<Q", data, position)[0]
+            value = data[position + 8:position + 8 + length]
+            position += 8 + length
+        elif itemType == 11:
+            numItems, _ = struct.unpack_from("<IQ", data, position)
+            value, position = _readVariant(data, position + 12, numItems)
+            #Skip the table of item offsets that follows the items
+            position += 8 * numItems
+        else:
+            raise UnsupportedFileError("Unknown item type {}".format(itemType))
+
+        result[name] = value
+
+    return result, position
+
+
+def readImageAttributes(data, chunks):
+    """
+    Parses the image attributes of an ND2 file
+
+    Args:
+        data (buffer): Contents of the file
+        chunks (dict): Chunk map from :func:`readChunkMap`
+
+    Returns:
+        attributes (dict): Image attributes, with the same names as the fields of :class:`nd2ReadSDK.LIMATTRIBUTES` (uiCompression is called eCompression)
+
+    Raises:
+        UnsupportedFileError: If the attributes cannot be parsed
+
+    """
+    if b"ImageAttributesLV!" not in chunks:
+        raise UnsupportedFileError("No image attributes chunk")
+
+    offset, _ = chunks[b"ImageAttributesLV!"]
+    nameLength, dataLength = _readChunkHeader(data, offset)
+    start = offset + _CHUNK_HEADER.size + nameLength
+
+    try:
+        attributes, _ = _readVariant(bytes(data[start:start + dataLength]), 0)
+    except (struct.error, UnicodeDecodeError, IndexError) as err:
+        raise UnsupportedFileError("Cannot parse image attributes: {}".format(err))
+
+    return attributes.get("SLxImageAttributes", attributes)
+
+
+class ND2Memmap:
+    """
+    Zero-copy access to the frames of an uncompressed ND2 file
+
+    """
+
+    def __init__(self, pathIn, attributes=None):
+        """
+        Attributes:
+            widthPx (int): Width of image in pixels
+            heightPx (int): Height of image in pixels
+            numChannels (int): Number of components
+            bitsPerComponent (int): Number of bits per component in memory
+            numFrames (int): Number of frames
+
+        Args:
+            pathIn (str or Path): Path to the ND2 file
+            attributes (:class:`nd2ReadSDK.LIMATTRIBUTES`): Attributes reported by the SDK (optional). If given, the file is only accepted if the attributes parsed from the file describe the same image geometry, and the frame count reported by the SDK is used.
+
+        Raises:
+            UnsupportedFileError: If the file is compressed, tiled or not recognized
+
+        """
+        self.filepath = Path(pathIn)
+        self._data = np.memmap(str(self.filepath), dtype=np.uint8, mode="r")
+        self._chunks = readChunkMap(self._data)
+
+        parsed = readImageAttributes(self._data, self._chunks)
+        if parsed.get("eCompression") != COMPRESSION_NONE:
+            raise UnsupportedFileError("File is compressed")
+
+        try:
+            self.widthPx = int(parsed["uiWidth"])
+            self.heightPx = int(parsed["uiHeight"])
+            self.numChannels = int(parsed["uiComp"])
+            self.bitsPerComponent = int(parsed["uiBpcInMemory"])
+            self.numFrames = int(parsed["uiSequenceCount"])
+            self.widthBytes = int(parsed["uiWidthBytes"])
+        except (KeyError, TypeError, ValueError):
+            raise UnsupportedFileError("Image attributes are incomplete")
+
+        if attributes is not None:
+            #The row length in the file can differ from the one in memory,
+            #so only the image geometry is compared
+            if ((attributes.uiWidth, attributes.uiHeight, attributes.uiComp,
+                 attributes.uiBpcInMemory)
+                    != (self.widthPx, self.heightPx, self.numChannels, self.bitsPerComponent)):
+                raise UnsupportedFileError("File attributes do not match the SDK")
+            self.numFrames = int(attributes.uiSequenceCount)
+
+        tileWidth = parsed.get("uiTileWidth")
+        if tileWidth and tileWidth != self.widthPx:
+            raise UnsupportedFileError("Tiled images are not supported")
+        if self.bitsPerComponent not in (8, 16, 32):
+            raise UnsupportedFileError("Unsupported bits per component {}".format(self.bitsPerComponent))
+
+        self.dtype = np.dtype({8: np.uint8, 16: np.uint16, 32: np.float32}[self.bitsPerComponent])
+        rowBytes = self.widthPx * self.numChannels * self.dtype.itemsize
+        if self.widthBytes < rowBytes:
+            raise UnsupportedFileError("Row length does not match the image size")
+
+        self._offsets = np.empty(self.numFrames, dtype=np.int64)
+        for seq_index in range(self.numFrames):
+            self._offsets[seq_index] = self._frameOffset(seq_index)
+
+    def _frameOffset(self, seq_index):
+        name = "ImageDataSeq|{}!".format(seq_index).encode("ascii")
+        if name not in self._chunks:
+            raise UnsupportedFileError("Frame {} not found".format(seq_index))
+
+        offset, _ = self._chunks[name]
+        nameLength, dataLength = _readChunkHeader(self._data, offset)
+
+        #Image data starts with an 8-byte timestamp
+        if dataLength < 8 + self.heightPx * self.widthBytes:
+            raise UnsupportedFileError("Frame {} is smaller than expected".format(seq_index))
+
+        return offset + _CHUNK_HEADER.size + nameLength + 8
+
+    def frame(self, seq_index):
+        """
+        Returns a frame as a view of the file
+
+        Args:
+            seq_index (uint): Sequence index of frame
+
+        Returns:
+            np_array: Read-only (height, width, components) view of the file
+
+        Raises:
+            IndexError: If seq_index is out of range
+
+        """
+        if seq_index < 0 or seq_index >= self.numFrames:
+            raise IndexError("Frame {} out of range ({} frames)".format(seq_index, self.numFrames))
+
+        return np.ndarray((self.heightPx, self.widthPx, self.numChannels), self.dtype,
+                          self._data, offset=int(self._offsets[seq_index]),
+                          strides=(self.widthBytes, self.numChannels * self.dtype.itemsize,
+                                   self.dtype.itemsize))
+
+    def frameTime(self, seq_index):
+        """
+        Returns the timestamp stored with a frame
+
+        Args:
+            seq_index (uint): Sequence index of frame
+
+        Returns:
+            time (float): Time in milliseconds (see :class:`nd2ReadSDK.LIMLOCALMETADATA`)
+
+        """
+        offset = int(self._offsets[seq_index]) - 8
+
+        return float(np.frombuffer(self._data, np.float64, 1, offset)[0])
@@ -1,9 +1,452 @@
 import nd2ReadSDK as nd2
+import nd2sidecar
+import nd2mmap
+import nd2trace
 
 from pathlib import Path
-from ctypes import c_uint16, pointer, c_uint, POINTER, cast
+from ctypes import c_uint8, pointer, c_uint, POINTER, cast
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import threading
+import weakref
+import ctypes
+import asyncio
+import time
+import os
 import numpy as np
 
+
+class PicturePool:
+    """
+    Process-wide pool of SDK picture buffers
+
+    Picture buffers are allocated with :func:`nd2ReadSDK.Lim_InitPicture` and keyed by their geometry (width, height, bits per component, components). Readers borrow a buffer when they are opened and return it when they are closed, so opening many files of the same geometry reuses the same buffers instead of allocating new ones.
+
+    """
+
+    def __init__(self, maxIdle=8):
+        """
+        Args:
+            maxIdle (int): Maximum number of idle buffers kept per geometry. Buffers returned beyond this limit are destroyed.
+
+        """
+        self.maxIdle = maxIdle
+
+        self._idle = {}
+        self._numBorrowed = 0
+        self.borrowedBytes = 0
+        self.idleBytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(bpicture):
+        return (bpicture.uiWidth, bpicture.uiHeight,
+                bpicture.uiBitsPerComp, bpicture.uiComponents)
+
+    def acquire(self, width, height, bits_per_comp, num_comp):
+        """
+        Borrows a picture buffer, allocating one if none is idle
+
+        Args:
+            width (uint): Image width in pixels
+            height (uint): Image height in pixels
+            bits_per_comp (uint): Bits per component
+            num_comp (uint): Number of physical components
+
+        Returns:
+            bpicture (:class:`nd2ReadSDK.LIMPICTURE`): Picture buffer
+
+        """
+        with self._lock:
+            idle = self._idle.get((width, height, bits_per_comp, num_comp))
+            bpicture = idle.pop() if idle else None
+            self._numBorrowed += 1
+            if bpicture is not None:
+                self.idleBytes -= bpicture.uiSize
+                self.borrowedBytes += bpicture.uiSize
+
+        if bpicture is None:
+            try:
+                bpicture = nd2.Lim_InitPicture(width, height, bits_per_comp, num_comp)
+            except Exception:
+                with self._lock:
+                    self._numBorrowed -= 1
+                raise
+
+            with self._lock:
+                self.borrowedBytes += bpicture.uiSize
+            _checkMemory()
+
+        return bpicture
+
+    def release(self, bpicture):
+        """
+        Returns a borrowed picture buffer to the pool
+
+        Args:
+            bpicture (:class:`nd2ReadSDK.LIMPICTURE`): Buffer from :meth:`acquire`
+
+        Returns:
+            None
+
+        """
+        with self._lock:
+            self._numBorrowed -= 1
+            self.borrowedBytes -= bpicture.uiSize
+            idle = self._idle.setdefault(self._key(bpicture), [])
+
+            if len(idle) < self.maxIdle:
+                idle.append(bpicture)
+                self.idleBytes += bpicture.uiSize
+                bpicture = None
+
+        if bpicture is not None:
+            nd2.Lim_DestroyPicture(bpicture)
+
+        return None
+
+    def clear(self):
+        """ Destroys all idle buffers """
+        with self._lock:
+            idle = [bpicture for buffers in self._idle.values() for bpicture in buffers]
+            self._idle.clear()
+            self.idleBytes = 0
+
+        for bpicture in idle:
+            nd2.Lim_DestroyPicture(bpicture)
+
+    @property
+    def numIdle(self):
+        """ Number of idle buffers held by the pool """
+        with self._lock:
+            return sum(len(buffers) for buffers in self._idle.values())
+
+    @property
+    def numBorrowed(self):
+        """ Number of buffers currently borrowed by readers """
+        return self._numBorrowed
+
+
+#Pool shared by all readers in the process
+picturePool = PicturePool()
+
+#Open readers, for process-wide memory accounting
+_openReaders = weakref.WeakSet()
+
+#Other objects holding frame memory (see _registerMemory)
+_memoryHolders = weakref.WeakSet()
+
+_memoryLimit = {"limit": None, "callback": None, "exceeded": False, "peak": 0}
+_memoryLock = threading.Lock()
+
+
+def memory_report():
+    """
+    Returns the memory held by all readers in the process
+
+    Picture buffers are counted once, at the pool. Memory owned by the SDK internally (e.g. file caches) is not included.
+
+    Returns:
+        report (dict): Bytes per resource class
+            pictureBuffersBorrowed: LIMPICTURE buffers in use by readers and their worker threads
+            pictureBuffersIdle: LIMPICTURE buffers kept by :data:`picturePool` for reuse
+            caches: Cached results such as channel histograms
+            indexes: Index tables such as the frame time index
+            metadata: Cached metadata structures
+            frameCaches: Decoded frames held by :class:`nd2cache.FrameCache` instances (e.g. of :class:`nd2server.FrameServer` and :class:`nd2loader.PatchLoader`)
+            sharedMemory: Shared memory slots of :class:`nd2broker.FrameBroker` instances created in this process
+            total: Sum of the above
+            peak: Highest total seen by the memory limit check
+            numReaders: Number of open readers
+
+    """
+    report = {"pictureBuffersBorrowed": picturePool.borrowedBytes,
+              "pictureBuffersIdle": picturePool.idleBytes,
+              "caches": 0,
+              "indexes": 0,
+              "metadata": 0,
+              "frameCaches": 0,
+              "sharedMemory": 0}
+
+    readers = list(_openReaders)
+    for reader in readers:
+        readerReport = reader.memory_report()
+        for key in ("caches", "indexes", "metadata"):
+            report[key] += readerReport[key]
+
+    for holder in list(_memoryHolders):
+        report[holder.memoryClass] += holder.numBytes
+
+    report["total"] = sum(report.values())
+    report["peak"] = max(_memoryLimit["peak"], report["total"])
+    report["numReaders"] = len(readers)
+
+    return report
+
+
+def set_memory_limit(limit, callback):
+    """
+    Sets a high-water mark for the memory held by readers
+
+    The total from :func:`memory_report` is checked whenever a reader allocates a picture buffer or stores a cache or index, a frame cache stores a frame, or a frame broker allocates its shared memory. callback(report) is called once when the total first exceeds the limit, and again only after the total has dropped back below it. The callback can e.g. raise an alert or clear caches.
+
+    Args:
+        limit (int): Limit in bytes (None to disable)
+        callback (callable): Called with the report from :func:`memory_report`
+
+    Returns:
+        None
+
+    """
+    with _memoryLock:
+        _memoryLimit["limit"] = limit
+        _memoryLimit["callback"] = callback
+        _memoryLimit["exceeded"] = False
+
+
+def _registerMemory(holder):
+    """
+    Adds an object to the process-wide memory accounting of :func:`memory_report`
+
+    The holder is kept by weak reference. It must have a memoryClass attribute with the report key it is counted under ("frameCaches" or "sharedMemory") and a numBytes attribute with the bytes it currently holds. The holder should call :func:`_checkMemory` when numBytes grows.
+
+    """
+    _memoryHolders.add(holder)
+
+
+def _checkMemory():
+    """ Updates the peak and calls the memory limit callback if needed """
+    report = memory_report()
+
+    with _memoryLock:
+        _memoryLimit["peak"] = report["peak"]
+        limit = _memoryLimit["limit"]
+        callback = _memoryLimit["callback"]
+
+        if limit is None or report["total"] <= limit:
+            _memoryLimit["exceeded"] = False
+            return
+        if _memoryLimit["exceeded"]:
+            return
+        _memoryLimit["exceeded"] = True
+
+    if callback is not None:
+        callback(report)
+
+
+def _npDtype(bitsPerComponent):
+    """ Returns the numpy dtype used to hold components of the given size """
+    if bitsPerComponent == 8:
+        return np.uint8
+
+    return np.uint16 #By default set to uint16
+
+
+def _pictureArray(bpicture):
+    """
+    Returns a numpy view of the data in a picture buffer
+
+    The view shares memory with the buffer, so its contents change when the buffer is reused.
+
+    Args:
+        bpicture (:class:`nd2ReadSDK.LIMPICTURE`): Initialized picture object
+
+    Returns:
+        np_array: A (height, width, components) view of the picture data
+
+    """
+    dtype = np.dtype(_npDtype(bpicture.uiBitsPerComp))
+    data = (c_uint8 * bpicture.uiSize).from_address(bpicture.pImageData)
+
+    return np.ndarray((bpicture.uiHeight, bpicture.uiWidth, bpicture.uiComponents),
+                      dtype, data,
+                      strides=(bpicture.uiWidthBytes,
+                               bpicture.uiComponents * dtype.itemsize,
+                               dtype.itemsize))
+
+
+def _convertInto(out, frame, conversion):
+    """
+    Writes (frame - offset) * gain into out
+
+    The values are converted directly from the picture buffer into out. Offset and gain can be scalars or per-component arrays. For integer output types, the values are rounded to the nearest integer and clipped to the range of the type.
+
+    """
+    _, offset, gain = conversion
+
+    if np.all(offset == 0) and np.all(gain == 1):
+        np.copyto(out, frame, casting="unsafe")
+        return out
+
+    if np.issubdtype(out.dtype, np.integer):
+        #Round and clip in floating point, since casting into out would
+        #truncate the values and wrap them around
+        info = np.iinfo(out.dtype)
+        scaled = (frame - np.asarray(offset, dtype=np.float64)) * gain
+        np.rint(scaled, out=scaled)
+        np.clip(scaled, info.min, info.max, out=scaled)
+        np.copyto(out, scaled, casting="unsafe")
+        return out
+
+    #Fold the offset into a bias so that the conversion is one multiply-add
+    #into out, with no temporary the size of the frame
+    bias = -np.asarray(offset) * gain
+    np.multiply(frame, gain, out=out, casting="unsafe")
+    if np.any(bias != 0):
+        np.add(out, bias, out=out, casting="unsafe")
+
+    return out
+
+
+#Experiment loop types (LIMLOOP_TIME, LIMLOOP_MULTIPOINT, LIMLOOP_Z, LIMLOOP_OTHER)
+#and the letters used for them in axis strings
+AXES = "TPZO"
+
+#User events returned by ND2reader.getEvents
+EVENT_DTYPE = np.dtype([("id", np.uint32), ("time", np.float64), ("type", "U128"),
+                        ("description", "U256"), ("seq_index", np.int64)])
+
+
+def _axisNumbers(axes):
+    """ Converts an axis string (e.g. "TP") into loop type numbers """
+    axes = axes.upper()
+
+    for axis in axes:
+        if axis not in AXES:
+            raise ValueError("Unknown axis {} (expected one of {})".format(axis, AXES))
+    if len(set(axes)) != len(axes):
+        raise ValueError("Axis string {} contains duplicate axes".format(axes))
+
+    return [AXES.index(axis) for axis in axes]
+
+
+def _nearestRank(times, t):
+    """ Returns the index of the value closest to each t in sorted times """
+    if len(times) == 0:
+        raise ValueError("No frames to search")
+
+    t = np.asarray(t, dtype=np.float64)
+    right = np.clip(np.searchsorted(times, t), 1, max(len(times) - 1, 1))
+    left = right - 1
+    if len(times) == 1:
+        right = left = np.zeros_like(right)
+
+    return np.where(np.abs(times[left] - t) <= np.abs(times[right] - t), left, right)
+
+
+def _planReads(seqIndices):
+    """
+    Plans the reads needed for a selection of frames
+
+    Duplicate requests are merged and the frames are ordered by sequence index, which is the order they are stored in the file.
+
+    Args:
+        seqIndices (np_array): Requested sequence indices (in request order)
+
+    Returns:
+        plan (list): (seq_index, targets) pairs sorted by seq_index, where targets are the positions in the request that receive the frame
+
+    """
+    order = np.argsort(seqIndices, kind="stable")
+    unique, starts = np.unique(seqIndices[order], return_index=True)
+
+    return [(int(seq_index), targets)
+            for seq_index, targets in zip(unique, np.split(order, starts[1:]))]
+
+
+class _FrameReader:
+    """
+    File handle and picture buffer owned by a single worker thread
+
+    The picture buffer is reused for every read, so a _FrameReader must not be shared between threads.
+
+    """
+
+    def __init__(self, filepath, widthPx, heightPx, bitsPerComponent, numChannels):
+        self._fhandle = nd2.Lim_FileOpenForRead(str(filepath))
+        try:
+            self._bpicture = picturePool.acquire(widthPx, heightPx,
+                                                 bitsPerComponent, numChannels)
+        except Exception:
+            nd2.Lim_FileClose(self._fhandle)
+            raise
+        self.frame = _pictureArray(self._bpicture)
+
+    def read(self, seq_index):
+        """
+        Reads a frame into the picture buffer
+
+        Args:
+            seq_index (uint): Sequence index of frame
+
+        Returns:
+            frame (np_array): View of the picture buffer (valid until the next read)
+            imgMD (:class:`nd2ReadSDK.LIMLOCALMETADATA`): Frame metadata
+
+        """
+        imgMD = nd2.Lim_FileGetImageData(self._fhandle, seq_index, self._bpicture)
+
+        return self.frame, imgMD
+
+    def close(self):
+        picturePool.release(self._bpicture)
+        nd2.Lim_FileClose(self._fhandle)
+
+
+class _ReaderPool:
+    """
+    Worker threads with one :class:`_FrameReader` each
+
+    The handles and picture buffers are opened once and reused by every call to :meth:`map`, e.g. for all blocks of an iteration.
+
+    """
+
+    def __init__(self, reader, numWorkers):
+        self._executor = None
+        self.frameReaders = []
+        try:
+            for _ in range(numWorkers):
+                self.frameReaders.append(reader._openFrameReader())
+        except Exception:
+            self.close()
+            raise
+
+        if numWorkers > 1:
+            self._executor = ThreadPoolExecutor(numWorkers)
+
+    def __len__(self):
+        return len(self.frameReaders)
+
+    def map(self, func, chunks):
+        """
+        Runs func(frameReader, chunk) for each chunk on its own worker
+
+        Args:
+            func (callable): Called as func(frameReader, chunk)
+            chunks (list): At most one chunk per worker
+
+        Returns:
+            results (list): Return values of func, one per chunk in order
+
+        """
+        args = list(zip(self.frameReaders, chunks))
+
+        if self._executor is None or len(args) <= 1:
+            return [func(*arg) for arg in args]
+
+        return list(self._executor.map(lambda arg: func(*arg), args))
+
+    def close(self):
+        """ Stops the workers and closes their handles """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+        for frameReader in self.frameReaders:
+            frameReader.close()
+        self.frameReaders = []
+
+
 class ND2reader:
     """  
     Class to read ND2 files
@@ -12,18 +455,28 @@ class ND2reader:
     Nikon microscope. The class uses the official ND2 SDK 
     libraries v9.0.
 
+    The reader holds an open file handle and a picture buffer borrowed from :data:`picturePool`. Both are released by :meth:`close`, which is called automatically when the reader is used as a context manager::
+
+        with ND2reader("file.nd2") as reader:
+            im = reader.getImage(0)
+
     """
 
-    def __init__(self, pathIn):
+    _closed = True
+
+    def __init__(self, pathIn, sidecar=None, memmap=True):
         """ 
         Attributes:        
             bitsPerComponent (int): Number of bits per component (channel) of                           an image
+            significantBits (int): Number of significant bits per component
             heightPx (int): Height of image in pixels
             widthPx (int): Width of image in pixels
             frameCount (int): Number of frames
 
         Returns:
             pathIn (str): Path to a valid ND2 file            
+            sidecar (bool or str): If True, cache computed values in a sidecar file next to the ND2 file. A path can be given to use a different location. Disabled by default.
+            memmap (bool): If True, frames of uncompressed files are read directly from a memory map of the file instead of through the SDK (see :mod:`nd2mmap`). Files that are compressed or not recognized are always read through the SDK.
 
         """
        
@@ -43,19 +496,71 @@ class ND2reader:
         self.heightPx = limattributes.uiHeight
         self.bitsPerComponent = limattributes.uiBpcInMemory
         self.numChannels = limattributes.uiComp
+        self.significantBits = limattributes.uiBpcSignificant
         self.numFrames = limattributes.uiSequenceCount
+        self.compression = limattributes.uiCompression
+        self.quality = limattributes.uiQuality
+
+        self._useMemmap = memmap
+        self._mmap = self._openMemmap(limattributes)
         
+        if sidecar is True:
+            self._sidecarPath = nd2sidecar.sidecarPath(self.filepath)
+        elif sidecar:
+            self._sidecarPath = Path(sidecar)
+        else:
+            self._sidecarPath = None
 
-        print(type(limattributes.uiWidthBytes))
+        self._histCache = {}
+        self._expmd = None
+        self._transforms = []
+        self._transformOutputs = []
+        self._frameTimes = None
+        self._timeIndex = None
+        self._events = None
 
-        #Initialize a read buffer for the picture
-        self._bpicture = nd2.Lim_InitPicture(self.widthPx, self.heightPx, 
-                                             self.bitsPerComponent, 
-                                             self.numChannels)
+        #Borrow a read buffer for the picture
+        try:
+            self._bpicture = picturePool.acquire(self.widthPx, self.heightPx, 
+                                                 self.bitsPerComponent, 
+                                                 self.numChannels)
+        except Exception:
+            nd2.Lim_FileClose(self._fhandle)
+            raise
+        self._closed = False
+        _openReaders.add(self)
 
         #Initialize a pointer to the picture buffer
-        self._bpicture_ptr = (c_uint16 * self.widthPx * self.heightPx * self.numChannels).from_address(self._bpicture.pImageData)
+        self._frame = _pictureArray(self._bpicture)
+
+
+    def close(self):
+        """
+        Closes the ND2 file and returns the picture buffer to the pool
+
+        Calling close() more than once has no effect.
+
+        """
+        if self._closed:
+            return
 
+        self._closed = True
+        _openReaders.discard(self)
+        self._mmap = None
+        self._frame = None
+        picturePool.release(self._bpicture)
+        nd2.Lim_FileClose(self._fhandle)
+
+    @property
+    def closed(self):
+        """ True if the reader has been closed """
+        return self._closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def __del__(self):
         """
@@ -63,40 +568,1096 @@ class ND2reader:
         Closes the ND2 file (if open)
 
         """
-        nd2.Lim_DestroyPicture(self._bpicture)
-        nd2.Lim_FileClose(self._fhandle)
+        self.close()
+
+    def memory_report(self):
+        """
+        Returns the memory held by this reader
+
+        Picture buffers borrowed by worker threads are only counted in the process-wide :func:`memory_report`.
+
+        Returns:
+            report (dict): Bytes per resource class
+                pictureBuffer: The reader's LIMPICTURE buffer
+                caches: Cached channel histograms
+                indexes: Frame time table, time index, user events and memory map frame offsets
+                metadata: Cached experiment structure
+                total: Sum of the above
+
+        """
+        indexes = [self._frameTimes] if self._frameTimes is not None else []
+        if self._timeIndex is not None:
+            indexes += list(self._timeIndex)
+        if self._events is not None:
+            indexes.append(self._events)
+        if self._mmap is not None:
+            indexes.append(self._mmap._offsets)
+
+        report = {"pictureBuffer": 0 if self._closed else self._bpicture.uiSize,
+                  "caches": sum(hist.nbytes for hist in self._histCache.values()),
+                  "indexes": sum(array.nbytes for array in indexes),
+                  "metadata": ctypes.sizeof(self._expmd) if self._expmd is not None else 0}
+        report["total"] = sum(report.values())
+
+        return report
+
+    def _openMemmap(self, limattributes):
+        """ Returns an :class:`nd2mmap.ND2Memmap` of the file, or None if it cannot be used """
+        if not self._useMemmap or limattributes.uiCompression != nd2mmap.COMPRESSION_NONE:
+            return None
+
+        try:
+            return nd2mmap.ND2Memmap(self.filepath, limattributes)
+        except (ValueError, OSError):
+            #Not recognized (nd2mmap.UnsupportedFileError) or cannot be mapped
+            return None
+
+    @property
+    def usesMemmap(self):
+        """ True if frames are read from a memory map of the file instead of through the SDK """
+        return self._mmap is not None
+
+    def _checkOpen(self):
+        if self._closed:
+            raise ValueError("I/O operation on closed ND2 file")
         
-    def getImage(self, *index):
+    def getImage(self, *index, dtype=None, normalize=None):
         """
         Returns the specified image as a numpy ndarray
 
         Note that the API always returns all channels of the specified image at once.
 
+        The image can be converted and normalized while it is copied out of the SDK buffer, as (value - offset) * gain, without intermediate arrays. normalize can be:
+
+        * "bits": scale to [0, 1] by the number of significant bits
+        * "channels": scale each channel to [0, 1] by its min and max over the file (see :meth:`channel_stats`)
+        * (offset, gain): scalars or per-channel sequences
+
         Args:
             *index (uint): Either image coordinates or index
+            dtype: Data type of the returned array (default: the stored type, or float32 if normalize is given)
+            normalize (str or tuple): Intensity normalization (default: none)
 
         Returns:
             np_array: A numpy ND array containing the image
 
+        Raises:
+            ValueError: If the reader has been closed or normalize is invalid
+
         """
+        self._checkOpen()
 
-        if len(index) == 1:
-            seq_index = index[0]
-        else:
-            seq_index = nd2.Lim_GetSeqIndexFromCoords(self._fhandle, *index)
+        conversion = self._conversion(dtype, normalize)
+        seq_index = self.getSeqIndex(*index)
 
         #Retrieve the image
-        imgMD = nd2.Lim_FileGetImageData(self._fhandle, seq_index, self._bpicture)
+        if self._mmap is not None:
+            frame = self._mmap.frame(seq_index)
+        else:
+            imgMD = nd2.Lim_FileGetImageData(self._fhandle, seq_index, self._bpicture)
+            frame = self._frame
+
+        with nd2trace.span("copy", seq_index=seq_index):
+            if self._transforms:
+                return self._frameWriter(conversion)(None, frame)
+
+            if conversion is not None:
+                np_array = np.empty(frame.shape, conversion[0])
+                return _convertInto(np_array, frame, conversion)
+
+            #The frame view honours the row padding of the picture buffer
+            return frame.copy()
+
+    def getImageView(self, *index):
+        """
+        Returns the specified image as a read-only view of the file
+
+        No data is copied. This is only available for uncompressed files (see :attr:`usesMemmap`).
+
+        Args:
+            *index (uint): Either image coordinates or index
+
+        Returns:
+            np_array: A read-only (height, width, components) view of the image
+
+        Raises:
+            ValueError: If the file is not memory-mapped or the reader has been closed
+
+        """
+        self._checkOpen()
+
+        if self._mmap is None:
+            raise ValueError("Image views are only available for uncompressed files")
 
-        #Set the number of significant bits
-        if self.bitsPerComponent == 16:
-            np_bits = np.uint16
-        elif self.bitsPerComponent == 8:
-            np_bits = np.uint8
+        return self._mmap.frame(self.getSeqIndex(*index))
+
+    def getROI(self, roi, *index, dtype=None, normalize=None):
+        """
+        Returns a rectangular region of an image
+
+        The region is read with Lim_FileGetImageRectData (or sliced from the memory map of uncompressed files), so the picture buffer is not used. The transform pipeline is not applied to regions.
+
+        Args:
+            roi (tuple): (y0, y1, x0, x1) pixel bounds of the region
+            *index (uint): Either image coordinates or index
+            dtype: Data type of the returned array (see :meth:`getImage`)
+            normalize (str or tuple): Intensity normalization (see :meth:`getImage`)
+
+        Returns:
+            np_array: A (y1 - y0, x1 - x0, components) array containing the region
+
+        Raises:
+            ValueError: If the region is empty or outside the image, or the reader has been closed
+
+        """
+        self._checkOpen()
+
+        y0, y1, x0, x1 = [int(val) for val in roi]
+        if not (0 <= y0 < y1 <= self.heightPx and 0 <= x0 < x1 <= self.widthPx):
+            raise ValueError("Region {} is empty or outside the {}x{} image".format(
+                roi, self.heightPx, self.widthPx))
+
+        conversion = self._conversion(dtype, normalize)
+        seq_index = self.getSeqIndex(*index)
+
+        if self._mmap is not None:
+            region = self._mmap.frame(seq_index)[y0:y1, x0:x1]
         else:
-            np_bits = np.uint16 #By default set to uint16
+            region = np.empty((y1 - y0, x1 - x0, self.numChannels), _npDtype(self.bitsPerComponent))
+            nd2.Lim_FileGetImageRectData(self._fhandle, seq_index, self.widthPx, self.heightPx,
+                                         x0, y0, x1 - x0, y1 - y0, region.ctypes.data,
+                                         region.strides[0])
+
+        with nd2trace.span("copy", seq_index=seq_index):
+            if conversion is not None:
+                return _convertInto(np.empty(region.shape, conversion[0]), region, conversion)
+
+            return region.copy() if self._mmap is not None else region
+
+    def getSeqIndex(self, *index):
+        """
+        Returns the sequence index of an image
+
+        Args:
+            *index (uint): Either image coordinates or index
+
+        Returns:
+            seq_index (int): Sequence index of the image
+
+        """
+        if len(index) == 1:
+            return int(index[0])
+
+        return nd2.Lim_GetSeqIndexFromCoords(self.experiment, *index)
+
+    def getImages(self, indices, dtype=None, normalize=None, numWorkers=1):
+        """
+        Returns several images as a single numpy ndarray
+
+        The requested images are resolved to sequence indices first and then read in file order, with each distinct frame read only once. The images are returned in the order they were requested.
+
+        With more than one worker, the planned reads are split into contiguous runs that are read by worker threads with their own file handles. The conversion and the transform pipeline (see :meth:`addTransform`) run in the same threads.
+
+        Args:
+            indices (iterable): Sequence indices and/or coordinate tuples
+            dtype: Data type of the returned array (see :meth:`getImage`)
+            normalize (str or tuple): Intensity normalization (see :meth:`getImage`)
+            numWorkers (int): Number of worker threads (None: CPU count)
+
+        Returns:
+            np_array: A (n, height, width, components) array of the images
+
+        Raises:
+            ValueError: If the reader has been closed or normalize is invalid
+
+        """
+        self._checkOpen()
+
+        conversion = self._conversion(dtype, normalize)
+
+        seqIndices = np.array([self.getSeqIndex(*index) if isinstance(index, (tuple, list))
+                               else self.getSeqIndex(index) for index in indices],
+                              dtype=np.int64)
+
+        shape, outDtype = self._outputInfo(conversion)
+        images = np.empty((len(seqIndices),) + shape, outDtype)
+
+        with nd2trace.span("getImages", frames=len(seqIndices), numWorkers=numWorkers):
+            return self._readInto(images, seqIndices, conversion, numWorkers)
+
+    def _conversion(self, dtype, normalize):
+        """
+        Resolves the dtype and normalize arguments of the read methods
+
+        Returns:
+            conversion (tuple): (dtype, offset, gain), or None if the stored values are returned unchanged
+
+        """
+        if normalize is None:
+            if dtype is None or np.dtype(dtype) == np.dtype(_npDtype(self.bitsPerComponent)):
+                return None
+            return (np.dtype(dtype), 0, 1)
+
+        if isinstance(normalize, str):
+            if normalize == "bits":
+                offset = 0
+                gain = 1.0 / ((1 << (self.significantBits or self.bitsPerComponent)) - 1)
+            elif normalize == "channels":
+                stats = self.channel_stats(bins=1)
+                offset = stats["min"].astype(np.float64)
+                gain = 1.0 / np.maximum(stats["max"] - offset, 1)
+            else:
+                raise ValueError("Unknown normalization {}".format(normalize))
+        else:
+            offset, gain = normalize
+            offset = np.asarray(offset, dtype=np.float64)
+            gain = np.asarray(gain, dtype=np.float64)
+
+        return (np.dtype(dtype if dtype is not None else np.float32), offset, gain)
+
+    def addTransform(self, func, outputShape=None, outputDtype=None):
+        """
+        Adds a per-frame transform to the end of the pipeline
+
+        Transforms are applied by :meth:`getImage`, :meth:`getImages` and :meth:`iter_chunks` to every frame, after the dtype conversion and normalization, in the thread that read the frame. Each transform is called with the (height, width, components) frame. It should either modify the frame in place and return None (e.g. flat-field correction or background subtraction), or return a new array (e.g. a cropped view or a binned frame). Transforms are only called with frames read from the file.
+
+        The output arrays are allocated before any frame is read, so a transform that changes the shape or data type of the frame must declare its result with outputShape and outputDtype. Results of another shape raise a ValueError, and results of another data type are cast to the declared one.
+
+        When the result of the pipeline has the shape and data type of the converted frame, the frames are transformed directly in the output array. Otherwise each reading thread keeps one scratch frame and copies the final result into the output.
+
+        Args:
+            func (callable): Transform, called as func(frame)
+            outputShape (tuple): (height, width, components) of the result (default: same as the input of the transform)
+            outputDtype: Data type of the result (default: same as the input of the transform)
+
+        Returns:
+            None
+
+        """
+        self._transforms.append(func)
+        self._transformOutputs.append((None if outputShape is None else tuple(int(val) for val in outputShape),
+                                       None if outputDtype is None else np.dtype(outputDtype)))
+
+    def clearTransforms(self):
+        """ Removes all transforms from the pipeline """
+        self._transforms = []
+        self._transformOutputs = []
+
+    @property
+    def transforms(self):
+        """ Transforms in the pipeline, in the order they are applied """
+        return tuple(self._transforms)
+
+    def _applyTransforms(self, frame):
+        for func in self._transforms:
+            with nd2trace.span("transform", func=getattr(func, "__name__", repr(func))):
+                result = func(frame)
+            if result is not None:
+                frame = result
+
+        return frame
+
+    def _outputInfo(self, conversion):
+        """
+        Returns the frame shape and dtype after conversion and transforms
+
+        The shape and dtype of the transform results are taken from :meth:`addTransform`. The transforms are not called.
+
+        Returns:
+            shape (tuple): Shape of an output frame
+            dtype (np.dtype): Data type of an output frame
+
+        """
+        shape = (self.heightPx, self.widthPx, self.numChannels)
+        dtype = np.dtype(conversion[0] if conversion else _npDtype(self.bitsPerComponent))
+
+        for outputShape, outputDtype in self._transformOutputs:
+            if outputShape is not None:
+                shape = outputShape
+            if outputDtype is not None:
+                dtype = outputDtype
+
+        return shape, dtype
+
+    def _frameWriter(self, conversion):
+        """
+        Returns a function that writes a decoded frame into an output frame
+
+        The function is called as write(dest, frame) with a view of the picture buffer. It converts the frame, applies the transform pipeline and returns dest (or a new array if dest is None). Each reading thread must use its own writer.
+
+        """
+        if conversion is None:
+            conversion = (np.dtype(_npDtype(self.bitsPerComponent)), 0, 1)
+
+        scratch = []
+
+        def write(dest, frame):
+            if not self._transforms:
+                if dest is None:
+                    dest = np.empty(frame.shape, conversion[0])
+                return _convertInto(dest, frame, conversion)
+
+            #Transform directly in the output if it fits the converted frame
+            if dest is not None and dest.shape == frame.shape and dest.dtype == conversion[0]:
+                work = dest
+            else:
+                if not scratch:
+                    scratch.append(np.empty(frame.shape, conversion[0]))
+                work = scratch[0]
+
+            result = self._applyTransforms(_convertInto(work, frame, conversion))
+
+            if dest is None:
+                return np.array(result, copy=True)
+            if result is not dest:
+                if np.shape(result) != dest.shape:
+                    raise ValueError("Transforms returned shape {} instead of {}; declare the shape "
+                                     "with addTransform(outputShape=...)".format(np.shape(result), dest.shape))
+                dest[...] = result
+            return dest
+
+        return write
+
+    def _readInto(self, out, seqIndices, conversion=None, numWorkers=1, frameReader=None, pool=None):
+        """
+        Reads frames into a preallocated (n, ...) array
+
+        The reads are planned with :func:`_planReads`, so frames are read in file order and duplicates are read once. Each frame is written with a :meth:`_frameWriter`, which applies the conversion and transforms. With more than one worker, contiguous runs of the plan are read in parallel by :meth:`_mapChunks`, using the workers of pool if given (see :meth:`_openReaderPool`). If frameReader is given, all frames are read through it instead of the reader's own handle. Memory-mapped files are always read from the memory map.
+
+        """
+        plan = _planReads(seqIndices)
+
+        def fillFrames(read, planIndices):
+            write = self._frameWriter(conversion)
+            for iP in planIndices:
+                seq_index, targets = plan[iP]
+                frame = read(seq_index)
+                with nd2trace.span("copy", seq_index=int(seq_index), frame=int(targets[0])):
+                    write(out[targets[0]], frame)
+                    out[targets[1:]] = out[targets[0]]
+
+        if self._mmap is not None:
+            read = self._mmap.frame
+
+            if numWorkers == 1 or len(plan) <= 1:
+                fillFrames(read, range(len(plan)))
+            else:
+                chunks = np.array_split(np.arange(len(plan)), numWorkers or os.cpu_count() or 1)
+                with ThreadPoolExecutor(len(chunks)) as executor:
+                    list(executor.map(lambda chunk: fillFrames(read, chunk), chunks))
+        elif frameReader is not None:
+            fillFrames(lambda seq_index: frameReader.read(seq_index)[0], range(len(plan)))
+        elif numWorkers == 1 or len(plan) <= 1:
+            def read(seq_index):
+                nd2.Lim_FileGetImageData(self._fhandle, seq_index, self._bpicture)
+                return self._frame
+
+            fillFrames(read, range(len(plan)))
+        else:
+            def fillChunk(frameReader, chunk):
+                fillFrames(lambda seq_index: frameReader.read(seq_index)[0], chunk)
+
+            self._mapChunks(fillChunk, np.arange(len(plan)), numWorkers, pool)
+
+        return out
+
+    @property
+    def experiment(self):
+        """ Experiment metadata (:class:`nd2ReadSDK.LIMEXPERIMENT`), read once and cached """
+        if self._expmd is None:
+            self._checkOpen()
+            self._expmd = nd2.Lim_FileGetExperiment(self._fhandle)
+
+        return self._expmd
+
+    def getInfo(self):
+        """
+        Returns the file metadata as a dictionary
+
+        Only metadata is read (no image data), so this is fast even for large files. All values are plain Python types and can be serialized as JSON.
+
+        Returns:
+            info (dict): Attributes, acquisition metadata, experiment loops and text info
+
+        """
+        self._checkOpen()
+
+        md = nd2.Lim_FileGetMetadata(self._fhandle)
+        textinfo = nd2.Lim_FileGetTextinfo(self._fhandle)
+        expmd = self.experiment
+
+        return {"path": str(self.filepath),
+                "widthPx": self.widthPx,
+                "heightPx": self.heightPx,
+                "numChannels": self.numChannels,
+                "bitsPerComponent": self.bitsPerComponent,
+                "significantBits": self.significantBits,
+                "numFrames": self.numFrames,
+                "compression": self.compression,
+                "quality": self.quality,
+                "timeStart": md.dTimeStart,
+                "calibration": md.dCalibration,
+                "objectiveName": md.wszObjectiveName,
+                "objectiveMag": md.dObjectiveMag,
+                "objectiveNA": md.dObjectiveNA,
+                "zoom": md.dZoom,
+                "channels": [{"name": md.pPlanes[iP].wszName,
+                              "ocName": md.pPlanes[iP].wszOCName,
+                              "colorRGB": md.pPlanes[iP].uiColorRGB,
+                              "emissionWL": md.pPlanes[iP].dEmissionWL}
+                             for iP in range(md.uiPlaneCount)],
+                "loops": [{"axis": AXES[expmd.pAllocatedLevels[iL].uiExpType],
+                           "size": expmd.pAllocatedLevels[iL].uiLoopSize,
+                           "interval": expmd.pAllocatedLevels[iL].dInterval}
+                          for iL in range(expmd.uiLevelCount)],
+                "textinfo": {name: getattr(textinfo, name)
+                             for name, _ in nd2.LIMTEXTINFO._fields_
+                             if getattr(textinfo, name)}}
+
+    @property
+    def loopSizes(self):
+        """ Size of the T, P (multipoint), Z and O (other) loops of the experiment (1 if absent) """
+        sizes = [1, 1, 1, 1]
+        expmd = self.experiment
+
+        for iL in range(expmd.uiLevelCount):
+            level = expmd.pAllocatedLevels[iL]
+            sizes[level.uiExpType] = level.uiLoopSize
+
+        return sizes
+
+    def _selectCoords(self, axes, fixed=None):
+        """
+        Returns the coordinates of every frame of a selection
+
+        Args:
+            axes (str): Axes that vary, outermost first (e.g. "TZ")
+            fixed (dict): Coordinates of the other axes, keyed by axis letter (default: 0)
+
+        Returns:
+            coords (np_array): (n, 4) array of coordinates in iteration order
+
+        """
+        varying = _axisNumbers(axes)
+        fixed = {AXES.index(axis.upper()): value for axis, value in (fixed or {}).items()}
+        sizes = self.loopSizes
+
+        for axisNum in varying:
+            if axisNum in fixed:
+                raise ValueError("Axis {} cannot be both varying and fixed".format(AXES[axisNum]))
+
+        grids = np.meshgrid(*[np.arange(sizes[axisNum]) for axisNum in varying], indexing="ij")
+
+        coords = np.zeros((grids[0].size if grids else 1, 4), dtype=np.int64)
+        for axisNum, value in fixed.items():
+            coords[:, axisNum] = value
+        for axisNum, grid in zip(varying, grids):
+            coords[:, axisNum] = grid.ravel()
+
+        return coords
+
+    def _seqIndices(self, coords):
+        """
+        Returns the sequence index of each frame of a selection
+
+        Args:
+            coords (np_array): (n, 4) coordinates (see :meth:`_selectCoords`)
+
+        Returns:
+            seqIndices (np_array): Sequence index of each frame. Frames that have not been acquired (e.g. the acquisition stopped early or is still running) have indices >= :attr:`numFrames`.
+
+        """
+        expmd = self.experiment
+
+        return np.array([nd2.Lim_GetSeqIndexFromCoords(expmd, *frameCoords)
+                         for frameCoords in coords.tolist()], dtype=np.int64)
+
+    def iter_chunks(self, axes="T", max_bytes=256 * 2**20, fixed=None,
+                    dtype=None, normalize=None, numWorkers=1):
+        """
+        Iterates over a selection of frames in blocks of bounded size
+
+        The number of frames per block is the largest that fits in max_bytes, based on the image size, number of components and bytes per component. All blocks are filled into the same buffer, so memory use does not grow with the size of the selection.
+
+        The selection is based on the loop sizes of the experiment. Frames that have not been acquired, because the acquisition stopped early or is still running (see :meth:`follow`), are left out, so the last block may be shorter and the coordinates then have gaps.
+
+        Example: all timepoints of the fourth position at Z = 2::
+
+            for block, coords in reader.iter_chunks("T", fixed={"P": 3, "Z": 2}):
+                process(block)
+
+        Args:
+            axes (str): Axes that vary, outermost first, using the letters T (time), P (multipoint), Z and O (other)
+            max_bytes (int): Maximum size of a block in bytes (at least one frame is always read)
+            fixed (dict): Coordinates of the other axes, keyed by axis letter (default: 0)
+            dtype: Data type of the blocks (see :meth:`getImage`)
+            normalize (str or tuple): Intensity normalization (see :meth:`getImage`)
+            numWorkers (int): Number of worker threads reading each block (see :meth:`getImages`)
+
+        Yields:
+            block (np_array): (n, height, width, components) frames. The buffer is reused, so copy the block to keep it past the next iteration.
+            coords (np_array): (n, 4) T, P, Z, O coordinates of the frames
+
+        Raises:
+            ValueError: If the axes are invalid or the reader has been closed
+
+        """
+        self._checkOpen()
+
+        conversion = self._conversion(dtype, normalize)
+        coords = self._selectCoords(axes, fixed)
+        seqIndices = self._seqIndices(coords)
+
+        acquired = seqIndices < self.numFrames
+        coords = coords[acquired]
+        seqIndices = seqIndices[acquired]
+
+        shape, dtype = self._outputInfo(conversion)
+        frameBytes = int(np.prod(shape)) * dtype.itemsize
+        chunkSize = int(max(1, min(max_bytes // frameBytes, len(seqIndices))))
+
+        buffer = np.empty((chunkSize,) + shape, dtype)
+
+        #The worker handles are kept open for all blocks
+        pool = self._openReaderPool(numWorkers)
+
+        try:
+            for start in range(0, len(seqIndices), chunkSize):
+                stop = min(start + chunkSize, len(seqIndices))
+                block = buffer[:stop - start]
+                yield (self._readInto(block, seqIndices[start:stop], conversion, numWorkers, pool=pool),
+                       coords[start:stop])
+        finally:
+            if pool is not None:
+                pool.close()
+
+    @property
+    def zStackHome(self):
+        """ Index of the Z plane at the home position (see :func:`nd2ReadSDK.Lim_GetZStackHome`) """
+        self._checkOpen()
+
+        return nd2.Lim_GetZStackHome(self._fhandle)
+
+    def iter_volumes(self, order="TP", prefetch=1, fixed=None, dtype=None, normalize=None):
+        """
+        Iterates over the Z-stacks of the file
+
+        One volume is yielded for each combination of the axes in order. Only complete volumes are yielded: if the acquisition stopped early or is still running (see :meth:`follow`), volumes with planes that have not been acquired yet are skipped. The next volumes are read by a background thread with its own file handle while the current volume is being processed. Volumes are filled into prefetch + 1 reused buffers.
+
+        Args:
+            order (str): Axes to iterate over, outermost first (must not contain Z)
+            prefetch (int): Number of volumes to read ahead
+            fixed (dict): Coordinates of the other axes, keyed by axis letter (default: 0)
+            dtype: Data type of the volumes (see :meth:`getImage`)
+            normalize (str or tuple): Intensity normalization (see :meth:`getImage`)
+
+        Yields:
+            volume (np_array): (Z, height, width, components) stack. The buffer is refilled as soon as the next iteration starts, so copy the volume to keep it past the current iteration.
+            coords (np_array): (Z, 4) T, P, Z, O coordinates of the planes. The plane at the home position of the Z drive is given by :attr:`zStackHome`.
+
+        Raises:
+            ValueError: If order contains Z or the reader has been closed
+
+        """
+        self._checkOpen()
+
+        if "Z" in order.upper():
+            raise ValueError("order must not contain Z")
+        if prefetch < 0:
+            raise ValueError("prefetch must not be negative")
+
+        conversion = self._conversion(dtype, normalize)
+        coords = self._selectCoords(order + "Z", fixed)
+        seqIndices = self._seqIndices(coords)
+
+        numZ = self.loopSizes[AXES.index("Z")]
+        seqIndices = seqIndices.reshape(-1, numZ)
+        coords = coords.reshape(-1, numZ, 4)
+
+        complete = (seqIndices < self.numFrames).all(axis=1)
+        seqIndices = seqIndices[complete]
+        coords = coords[complete]
+        numVolumes = len(seqIndices)
+
+        shape, outDtype = self._outputInfo(conversion)
+        buffers = [np.empty((numZ,) + shape, outDtype) for _ in range(min(prefetch + 1, numVolumes))]
+
+        frameReader = self._openFrameReader()
+        executor = ThreadPoolExecutor(1)
+        pending = deque()
+
+        def fill(iV):
+            with nd2trace.span("readVolume", volume=iV):
+                return self._readInto(buffers[iV % len(buffers)], seqIndices[iV], conversion,
+                                      frameReader=frameReader)
+
+        try:
+            for iV in range(len(buffers)):
+                pending.append(executor.submit(fill, iV))
+
+            for iV in range(numVolumes):
+                with nd2trace.span("waitVolume", volume=iV):
+                    volume = pending.popleft().result()
+                yield volume, coords[iV]
+
+                if iV + len(buffers) < numVolumes:
+                    pending.append(executor.submit(fill, iV + len(buffers)))
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            frameReader.close()
+
+    def __iter__(self):
+        """ Iterates over all frames in sequence order """
+        for seq_index in range(self.numFrames):
+            yield self.getImage(seq_index)
+
+    def refresh(self):
+        """
+        Updates the frame count of a file that is still being acquired
+
+        The attributes and experiment are re-read from the open handle. The file is not reopened.
+
+        Returns:
+            numNew (int): Number of frames added since the last refresh
+
+        """
+        self._checkOpen()
+
+        limattributes = nd2.Lim_FileGetAttributes(self._fhandle)
+        numNew = limattributes.uiSequenceCount - self.numFrames
+
+        if numNew != 0:
+            self.numFrames = limattributes.uiSequenceCount
+            self._mmap = self._openMemmap(limattributes)
+            self._expmd = None
+            self._histCache = {}
+            self._timeIndex = None
+            self._events = None
+
+        return max(numNew, 0)
+
+    def follow(self, start=0, pollInterval=0.5, idleTimeout=None):
+        """
+        Yields frames as they are added to a file that is still being acquired
+
+        Frames that are already in the file (from start onwards) are yielded first. The reader then polls for new frames with :meth:`refresh` and yields each new frame once. Polling only sleeps while no new frames are available.
+
+        Args:
+            start (int): Sequence index of the first frame to yield
+            pollInterval (float): Time between polls in seconds
+            idleTimeout (float): Stop after this many seconds without new frames (default: follow forever)
+
+        Yields:
+            seq_index (int): Sequence index of the frame
+            np_array: A numpy ND array containing the image
+
+        """
+        seq_index = start
+        lastFrame = time.monotonic()
+
+        while True:
+            while seq_index < self.numFrames:
+                yield seq_index, self.getImage(seq_index)
+                seq_index += 1
+                lastFrame = time.monotonic()
+
+            if idleTimeout is not None and time.monotonic() - lastFrame >= idleTimeout:
+                return
+
+            if self.refresh() == 0:
+                time.sleep(pollInterval)
+
+    async def afollow(self, start=0, pollInterval=0.5, idleTimeout=None):
+        """
+        Asynchronous version of :meth:`follow`
+
+        The frames are read in the default executor, so the event loop is not blocked by the SDK.
+
+        Args:
+            start (int): Sequence index of the first frame to yield
+            pollInterval (float): Time between polls in seconds
+            idleTimeout (float): Stop after this many seconds without new frames (default: follow forever)
+
+        Yields:
+            seq_index (int): Sequence index of the frame
+            np_array: A numpy ND array containing the image
+
+        """
+        loop = asyncio.get_running_loop()
+        seq_index = start
+        lastFrame = time.monotonic()
+
+        while True:
+            while seq_index < self.numFrames:
+                frame = await loop.run_in_executor(None, self.getImage, seq_index)
+                yield seq_index, frame
+                seq_index += 1
+                lastFrame = time.monotonic()
+
+            if idleTimeout is not None and time.monotonic() - lastFrame >= idleTimeout:
+                return
+
+            if await loop.run_in_executor(None, self.refresh) == 0:
+                await asyncio.sleep(pollInterval)
+
+    def _openFrameReader(self):
+        """ Opens an additional handle and picture buffer for a worker thread """
+        return _FrameReader(self.filepath, self.widthPx, self.heightPx,
+                            self.bitsPerComponent, self.numChannels)
+
+    def _openReaderPool(self, numWorkers):
+        """
+        Opens worker handles to reuse across several calls to :meth:`_readInto`
+
+        Args:
+            numWorkers (int): Number of worker threads (None: CPU count)
+
+        Returns:
+            pool (:class:`_ReaderPool`): Workers to pass to :meth:`_readInto` and close when done, or None if the reads do not need worker handles (one worker or a memory-mapped file)
+
+        """
+        if self._mmap is not None or numWorkers == 1:
+            return None
+
+        return _ReaderPool(self, max(numWorkers or os.cpu_count() or 1, 1))
+
+    def _mapChunks(self, func, seqIndices, numWorkers=None, pool=None):
+        """
+        Runs func over contiguous chunks of frames in parallel
+
+        The sequence indices are split into one chunk per worker. Each worker has its own :class:`_FrameReader`, so the SDK calls do not share a handle or picture buffer. The workers of pool are used if given, otherwise workers are opened for this call only.
+
+        Args:
+            func (callable): Called as func(frameReader, chunk)
+            seqIndices (array): Sequence indices to process
+            numWorkers (int): Number of worker threads (default: CPU count). Ignored if pool is given.
+            pool (:class:`_ReaderPool`): Open workers (see :meth:`_openReaderPool`)
+
+        Returns:
+            results (list): Return values of func, one per chunk in order
+
+        """
+        self._checkOpen()
+
+        if pool is not None:
+            numWorkers = len(pool)
+        elif numWorkers is None:
+            numWorkers = os.cpu_count() or 1
+
+        chunks = [chunk for chunk in np.array_split(np.asarray(seqIndices), max(numWorkers, 1))
+                  if len(chunk) > 0]
+
+        def run(frameReader, chunk):
+            with nd2trace.span("chunk", first=int(chunk[0]), frames=len(chunk)):
+                return func(frameReader, chunk)
+
+        if pool is not None:
+            return pool.map(run, chunks)
+
+        pool = _ReaderPool(self, len(chunks))
+        try:
+            return pool.map(run, chunks)
+        finally:
+            pool.close()
+
+    def _channelHistogram(self, sample_every, numWorkers=None):
+        """
+        Returns the full-resolution histogram of every channel
+
+        There is one bin per intensity level allowed by the number of significant bits. Values above that range are counted in the last bin. The histogram is cached in memory and in the sidecar (if enabled).
+
+        """
+        if sample_every in self._histCache:
+            return self._histCache[sample_every]
+
+        key = "channelHist_{}".format(sample_every)
+
+        if self._sidecarPath is not None:
+            stored = nd2sidecar.loadSidecar(self.filepath, self._sidecarPath)
+            if key in stored:
+                self._histCache[sample_every] = stored[key]
+                _checkMemory()
+                return stored[key]
+
+        numLevels = 1 << min(self.significantBits or self.bitsPerComponent,
+                             self.bitsPerComponent)
+        numChannels = self.numChannels
+
+        def partialHistogram(frameReader, chunk):
+            hist = np.zeros(numChannels * numLevels, dtype=np.int64)
+            offsets = np.arange(numChannels, dtype=np.intp) * numLevels
+
+            for seq_index in chunk:
+                frame, _ = frameReader.read(int(seq_index))
+                levels = np.minimum(frame, numLevels - 1).astype(np.intp)
+                levels += offsets
+                hist += np.bincount(levels.ravel(), minlength=hist.size)
+
+            return hist
+
+        seqIndices = np.arange(0, self.numFrames, sample_every)
+        hist = sum(self._mapChunks(partialHistogram, seqIndices, numWorkers),
+                   np.zeros(numChannels * numLevels, dtype=np.int64))
+        hist = hist.reshape(numChannels, numLevels)
+
+        self._histCache[sample_every] = hist
+        _checkMemory()
+        if self._sidecarPath is not None:
+            nd2sidecar.saveSidecar(self.filepath, {key: hist}, self._sidecarPath)
+
+        return hist
+
+    def channel_stats(self, bins=256, sample_every=1,
+                      percentiles=(0.1, 1, 50, 99, 99.9), numWorkers=None):
+        """
+        Returns intensity statistics of each channel over the whole file
+
+        The frames are read in parallel chunks and each worker computes a histogram over its chunk. The partial histograms are added together and all statistics are derived from the merged histogram, so different bins or percentiles do not require another pass over the file.
+
+        Args:
+            bins (int): Number of histogram bins spanning the significant bits
+            sample_every (int): Only use every n-th frame
+            percentiles (sequence): Percentiles to compute (0 - 100)
+            numWorkers (int): Number of worker threads (default: CPU count)
+
+        Returns:
+            stats (dict): Dictionary with the keys
+                min (np_array): Minimum value per channel
+                max (np_array): Maximum value per channel
+                percentiles (np_array): (channels, percentiles) values
+                histogram (np_array): (channels, bins) pixel counts
+                binEdges (np_array): Lower edges of the bins plus the upper edge of the last bin
+                framesSampled (int): Number of frames used
+
+        """
+        if sample_every < 1:
+            raise ValueError("sample_every must be at least 1")
+
+        hist = self._channelHistogram(sample_every, numWorkers)
+        numLevels = hist.shape[1]
+
+        bins = max(1, min(bins, numLevels))
+        binEdges = np.linspace(0, numLevels, bins + 1).astype(np.int64)
+        histogram = np.add.reduceat(hist, binEdges[:-1], axis=1)
+
+        levels = np.arange(numLevels)
+        cumulative = np.cumsum(hist, axis=1)
+        total = cumulative[:, -1:]
+        nonzero = hist > 0
+
+        minValue = np.where(nonzero.any(axis=1), nonzero.argmax(axis=1), 0)
+        maxValue = np.where(nonzero.any(axis=1),
+                            numLevels - 1 - nonzero[:, ::-1].argmax(axis=1), 0)
+
+        ranks = np.asarray(percentiles, dtype=np.float64) / 100.0
+        pctValues = np.zeros((hist.shape[0], ranks.size), dtype=np.int64)
+        for iC in range(hist.shape[0]):
+            #Channels without pixels (e.g. no frames acquired) keep zero percentiles
+            if total[iC, 0] == 0:
+                continue
+            targets = np.maximum(ranks * total[iC, 0], 1)
+            pctValues[iC] = levels[np.minimum(np.searchsorted(cumulative[iC], targets),
+                                              numLevels - 1)]
+
+        return {"min": minValue,
+                "max": maxValue,
+                "percentiles": pctValues,
+                "histogram": histogram,
+                "binEdges": binEdges,
+                "framesSampled": len(range(0, self.numFrames, sample_every))}
+
+
+    def getFrameTimes(self, numWorkers=None):
+        """
+        Returns the acquisition time of every frame
+
+        The times are taken from the frame metadata (:class:`nd2ReadSDK.LIMLOCALMETADATA`), which the SDK only returns together with the image data, so building the table reads every frame once (in parallel). For memory-mapped files, the times are read from the memory map instead (see :meth:`nd2mmap.ND2Memmap.frameTime`), without decoding any frame. The table is cached in memory and in the sidecar (if enabled). After :meth:`refresh`, only the new frames are read.
+
+        Args:
+            numWorkers (int): Number of worker threads (default: CPU count)
+
+        Returns:
+            times (np_array): Time of each frame in milliseconds relative to the first frame, indexed by sequence index
+
+        """
+        if self._frameTimes is None and self._sidecarPath is not None:
+            stored = nd2sidecar.loadSidecar(self.filepath, self._sidecarPath)
+            self._frameTimes = stored.get("frameTimes")
+
+        known = self._frameTimes if self._frameTimes is not None else np.empty(0)
+        if len(known) >= self.numFrames:
+            return known[:self.numFrames]
+
+        if self._mmap is not None:
+            newTimes = [np.array([self._mmap.frameTime(seq_index)
+                                  for seq_index in range(len(known), self.numFrames)], dtype=np.float64)]
+        else:
+            def readTimes(frameReader, chunk):
+                return np.array([frameReader.read(int(seq_index))[1].dTimeMSec
+                                 for seq_index in chunk], dtype=np.float64)
+
+            newTimes = self._mapChunks(readTimes, np.arange(len(known), self.numFrames),
+                                       numWorkers)
+        self._frameTimes = np.concatenate([known] + newTimes)
+        _checkMemory()
+
+        if self._sidecarPath is not None:
+            nd2sidecar.saveSidecar(self.filepath, {"frameTimes": self._frameTimes},
+                                   self._sidecarPath)
+
+        return self._frameTimes
+
+    def _getTimeIndex(self):
+        """
+        Returns the time index, building it if necessary
+
+        The index holds the sequence indices sorted by position and then by time, the matching sorted times, and the offset of each position in those arrays.
+
+        """
+        if self._timeIndex is None:
+            times = self.getFrameTimes()
+            positions = np.array([nd2.Lim_GetCoordsFromSeqIndex(self.experiment, seq_index)[1]
+                                  for seq_index in range(len(times))], dtype=np.int64)
+
+            order = np.lexsort((times, positions))
+            numPositions = int(positions.max()) + 1 if len(positions) else 0
+            offsets = np.searchsorted(positions[order], np.arange(numPositions + 1))
+
+            self._timeIndex = (order, times[order], offsets)
+            _checkMemory()
+
+        return self._timeIndex
+
+    def _positionSlice(self, position):
+        order, sortedTimes, offsets = self._getTimeIndex()
+
+        if position is None:
+            byTime = np.argsort(self.getFrameTimes(), kind="stable")
+            return byTime, self.getFrameTimes()[byTime]
+
+        if position < 0 or position >= len(offsets) - 1:
+            raise ValueError("Position {} does not exist (file has {} positions)".format(position, len(offsets) - 1))
+
+        start, stop = offsets[position], offsets[position + 1]
+
+        return order[start:stop], sortedTimes[start:stop]
+
+    def frames_between(self, t0, t1, position=None):
+        """
+        Returns the frames acquired within a time range
+
+        Args:
+            t0 (float): Start of the range in milliseconds (inclusive)
+            t1 (float): End of the range in milliseconds (inclusive)
+            position (int): Multipoint position (default: all positions)
+
+        Returns:
+            seqIndices (np_array): Sequence indices of the frames, sorted by time
+
+        Raises:
+            ValueError: If the position does not exist
+
+        """
+        seqIndices, times = self._positionSlice(position)
+        start = np.searchsorted(times, t0, side="left")
+        stop = np.searchsorted(times, t1, side="right")
+
+        return seqIndices[start:stop]
+
+    def nearest_frame(self, t, position=None):
+        """
+        Returns the frame acquired closest to a given time
+
+        Args:
+            t (float or array): Time(s) in milliseconds
+            position (int): Multipoint position (default: all positions)
+
+        Returns:
+            seq_index (int or np_array): Sequence index of the nearest frame for each time
+
+        Raises:
+            ValueError: If the position does not exist or has no frames
+
+        """
+        seqIndices, times = self._positionSlice(position)
+        nearest = _nearestRank(times, t)
+
+        return seqIndices[nearest] if nearest.ndim else int(seqIndices[nearest])
+
+    def getEvents(self):
+        """
+        Returns the user events recorded during acquisition (e.g. stimuli or perturbations)
+
+        All events are read in one pass with Lim_GetNextUserEvent. Each event is joined to the frame acquired closest to it (see :meth:`nearest_frame`), which reads the frame times on first use (see :meth:`getFrameTimes`). The table is cached in memory and in the sidecar (if enabled).
+
+        Returns:
+            events (np_array): Structured array (see :data:`EVENT_DTYPE`) sorted by time, with the event time in milliseconds and the sequence index of the nearest frame of any position (-1 if the file has no frames)
+
+        Raises:
+            ValueError: If the reader has been closed
+
+        """
+        self._checkOpen()
+
+        if self._events is None and self._sidecarPath is not None:
+            stored = nd2sidecar.loadSidecar(self.filepath, self._sidecarPath)
+            self._events = stored.get("events")
+
+        if self._events is not None:
+            return self._events
+
+        records = []
+        seen = set()
+        next_id = 0
+        while True:
+            event, next_id = nd2.Lim_GetNextUserEvent(self._fhandle, next_id)
+
+            #Stop if the SDK does not advance to a new event
+            if event is None or event.uiID in seen:
+                break
+
+            seen.add(event.uiID)
+            records.append((event.uiID, event.dTime, event.wsType, event.wsDescription, -1))
+
+        events = np.sort(np.array(records, dtype=EVENT_DTYPE), order=["time", "id"])
+        if len(events) > 0 and self.numFrames > 0:
+            events["seq_index"] = self.nearest_frame(events["time"])
+
+        self._events = events
+
+        if self._sidecarPath is not None:
+            nd2sidecar.saveSidecar(self.filepath, {"events": events}, self._sidecarPath)
+
+        return events
+
+    def eventFrames(self, before=0, after=0, position=None):
+        """
+        Returns windows of frames around each user event
+
+        The frames of a position are ordered by time, and the window of an event holds the frames from before frames ahead of to after frames past its nearest frame, e.g. for event-triggered averaging::
+
+            windows = reader.eventFrames(before=5, after=20, position=0)
+            average = np.mean([reader.getImages(window) for window in windows
+                               if (window >= 0).all()], axis=0)
+
+        Args:
+            before (int): Number of frames before the nearest frame
+            after (int): Number of frames after the nearest frame
+            position (int): Multipoint position (default: all positions)
+
+        Returns:
+            seqIndices (np_array): (events, before + after + 1) sequence indices, in the order of :meth:`getEvents`. Column before holds the nearest frame. Entries before the first or after the last frame are -1.
+
+        Raises:
+            ValueError: If the position does not exist or has no frames
+
+        """
+        events = self.getEvents()
+        seqIndices, times = self._positionSlice(position)
 
-        np_array = np.ndarray((self.heightPx, self.widthPx, self.numChannels),
-                              np_bits, self._bpicture_ptr).copy()
+        ranks = _nearestRank(times, events["time"])[:, np.newaxis] + np.arange(-before, after + 1)
+        valid = (ranks >= 0) & (ranks < len(times))
 
-        return np_array
\ No newline at end of file
+        return np.where(valid, seqIndices[np.clip(ranks, 0, len(times) - 1)], -1)
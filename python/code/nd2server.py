@@ -0,0 +1,345 @@
+""" Local frame server
+
+FrameServer serves frames from a set of ND2 files to clients on the same machine, over a Unix domain socket or a localhost TCP port. The files are opened through an :class:`nd2dataset.ND2Dataset`, so the number of open handles is bounded, and decoded frames are kept in a server-side cache.
+
+Protocol
+--------
+
+Every message is a 4-byte little-endian length followed by the payload.
+
+Requests are small UTF-8 JSON objects with an "op" key:
+
+* {"op": "info", "file": f}
+* {"op": "frame", "file": f, "index": [...]}
+* {"op": "roi", "file": f, "index": [...], "roi": [y0, y1, x0, x1]}
+* {"op": "thumbnail", "file": f, "index": [...], "maxSize": n}
+
+where "file" is the index of the file in the list given to the server, and "index" is a sequence index or coordinates as accepted by :meth:`nd2reader.ND2reader.getImage`.
+
+A response payload starts with a one-byte status. For pixel data (STATUS_ARRAY) the status is followed by a binary header (4-byte dtype string, 1-byte number of dimensions, 4-byte unsigned size of each dimension) and the raw C-ordered pixel bytes. For "info" (STATUS_JSON) and errors (STATUS_ERROR) it is followed by UTF-8 JSON text.
+
+"""
+
+from nd2dataset import ND2Dataset
+from nd2cache import FrameCache
+
+import socketserver
+import socket
+import struct
+import threading
+import json
+import os
+import numpy as np
+
+STATUS_ARRAY = 0
+STATUS_JSON = 1
+STATUS_ERROR = 2
+
+_LENGTH = struct.Struct("<I")
+_ARRAY_HEADER = struct.Struct("<4sB")
+
+
+def _checkUnixSockets(address):
+    if not HAS_UNIX_SOCKETS:
+        raise ValueError("Unix domain sockets are not available on this platform; "
+                         "use a (host, port) address instead of {!r}".format(address))
+
+
+def _recvExactly(sock, view):
+    """ Receives into a writable memoryview until it is full """
+    while len(view) > 0:
+        numBytes = sock.recv_into(view)
+        if numBytes == 0:
+            raise ConnectionError("Connection closed by peer")
+        view = view[numBytes:]
+
+
+def _recvMessage(sock):
+    header = bytearray(_LENGTH.size)
+    _recvExactly(sock, memoryview(header))
+    payload = bytearray(_LENGTH.unpack(header)[0])
+    _recvExactly(sock, memoryview(payload))
+
+    return payload
+
+
+def _sendMessage(sock, *parts):
+    length = sum(len(part) for part in parts)
+    sock.sendall(_LENGTH.pack(length))
+    for part in parts:
+        sock.sendall(part)
+
+
+def _arrayHeader(array):
+    dtypeStr = array.dtype.str.encode("ascii").ljust(4)
+
+    return (bytes([STATUS_ARRAY]) + _ARRAY_HEADER.pack(dtypeStr, array.ndim)
+            + struct.pack("<{}I".format(array.ndim), *array.shape))
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        server = self.server.frameServer
+
+        while True:
+            try:
+                request = json.loads(_recvMessage(self.request).decode("utf-8"))
+            except ConnectionError:
+                return
+
+            try:
+                result = server.handleRequest(request)
+            except Exception as err:
+                _sendMessage(self.request, bytes([STATUS_ERROR]),
+                             json.dumps({"error": repr(err)}).encode("utf-8"))
+                continue
+
+            if isinstance(result, np.ndarray):
+                result = np.ascontiguousarray(result)
+                _sendMessage(self.request, _arrayHeader(result), memoryview(result).cast("B"))
+            else:
+                _sendMessage(self.request, bytes([STATUS_JSON]),
+                             json.dumps(result).encode("utf-8"))
+
+
+#Unix domain sockets are not available on all platforms (e.g. Windows)
+HAS_UNIX_SOCKETS = hasattr(socket, "AF_UNIX")
+
+if HAS_UNIX_SOCKETS:
+    class _ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FrameServer:
+    """
+    Server for frames of a set of ND2 files
+
+    """
+
+    def __init__(self, paths, address, maxOpen=8, cacheBytes=256 * 2**20):
+        """
+        Attributes:
+            dataset (:class:`nd2dataset.ND2Dataset`): Files served
+            address: Address the server is bound to
+
+        Args:
+            paths (iterable): Paths to the ND2 files to serve
+            address (str or tuple): Path of a Unix domain socket, or a (host, port) tuple for TCP. Use ("127.0.0.1", 0) to pick a free port.
+            maxOpen (int): Maximum number of files kept open
+            cacheBytes (int): Size of the frame cache in bytes
+
+        Raises:
+            ValueError: If address is a path and Unix domain sockets are not available (see :data:`HAS_UNIX_SOCKETS`)
+
+        """
+        if not isinstance(address, tuple):
+            _checkUnixSockets(address)
+
+        self.dataset = ND2Dataset(paths, maxOpen=maxOpen)
+        self._cache = FrameCache(cacheBytes)
+
+        if isinstance(address, tuple):
+            self._server = _ThreadingTCPServer(address, _RequestHandler)
+        else:
+            if os.path.exists(address):
+                os.unlink(address)
+            self._server = _ThreadingUnixServer(address, _RequestHandler)
+
+        self._server.frameServer = self
+        self.address = self._server.server_address
+        self._thread = None
+
+    def _frame(self, fileIndex, index):
+        key = (fileIndex,) + tuple(index)
+        frame = self._cache.get(key)
+
+        if frame is None:
+            frame = self.dataset.getImage(fileIndex, *index)
+            self._cache.put(key, frame)
+
+        return frame
+
+    def handleRequest(self, request):
+        """
+        Returns the response to a decoded request
+
+        Args:
+            request (dict): Request (see module documentation)
+
+        Returns:
+            result (np_array or dict): Pixel data or metadata
+
+        Raises:
+            ValueError: If the operation is unknown
+
+        """
+        op = request["op"]
+        fileIndex = int(request["file"])
+
+        if op == "info":
+            return self.dataset.info(fileIndex)
+
+        frame = self._frame(fileIndex, [int(ii) for ii in request["index"]])
+
+        if op == "frame":
+            return frame
+        elif op == "roi":
+            y0, y1, x0, x1 = request["roi"]
+            return frame[y0:y1, x0:x1]
+        elif op == "thumbnail":
+            step = max(1, -(-max(frame.shape[:2]) // int(request["maxSize"])))
+            return frame[::step, ::step]
+
+        raise ValueError("Unknown operation {}".format(op))
+
+    def serve_forever(self):
+        """ Handles requests until :meth:`shutdown` is called """
+        self._server.serve_forever()
+
+    def start(self):
+        """ Starts serving requests in a background thread """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def shutdown(self):
+        """ Stops the server and closes all files """
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+
+        self._server.server_close()
+        self.dataset.close()
+
+        if not isinstance(self.address, tuple) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+
+class FrameServerClient:
+    """
+    Client for a :class:`FrameServer`
+
+    Pixel data is received directly into the memory of the returned array. A client holds one connection and must only be used by one thread at a time.
+
+    """
+
+    def __init__(self, address, timeout=None):
+        """
+        Args:
+            address (str or tuple): Address of the server
+            timeout (float): Socket timeout in seconds (default: no timeout)
+
+        Raises:
+            ValueError: If address is a path and Unix domain sockets are not available
+
+        """
+        if isinstance(address, tuple):
+            self._sock = socket.create_connection(address, timeout=timeout)
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            _checkUnixSockets(address)
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.settimeout(timeout)
+            self._sock.connect(address)
+
+    def close(self):
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _request(self, request):
+        _sendMessage(self._sock, json.dumps(request).encode("utf-8"))
+
+        header = bytearray(_LENGTH.size + 1)
+        _recvExactly(self._sock, memoryview(header))
+        length = _LENGTH.unpack_from(header)[0] - 1
+        status = header[-1]
+
+        if status != STATUS_ARRAY:
+            payload = bytearray(length)
+            _recvExactly(self._sock, memoryview(payload))
+            result = json.loads(payload.decode("utf-8"))
+            if status == STATUS_ERROR:
+                raise RuntimeError("Server error: {}".format(result["error"]))
+            return result
+
+        arrayHeader = bytearray(_ARRAY_HEADER.size)
+        _recvExactly(self._sock, memoryview(arrayHeader))
+        dtypeStr, ndim = _ARRAY_HEADER.unpack(arrayHeader)
+
+        shapeBytes = bytearray(4 * ndim)
+        _recvExactly(self._sock, memoryview(shapeBytes))
+        shape = struct.unpack("<{}I".format(ndim), shapeBytes)
+
+        array = np.empty(shape, np.dtype(dtypeStr.decode("ascii").strip()))
+        _recvExactly(self._sock, memoryview(array).cast("B"))
+
+        return array
+
+    def info(self, fileIndex):
+        """ Returns the attributes of a file (see :meth:`nd2dataset.ND2Dataset.info`) """
+        return self._request({"op": "info", "file": fileIndex})
+
+    def getImage(self, fileIndex, *index):
+        """
+        Returns a full frame
+
+        Args:
+            fileIndex (int): Index of the file on the server
+            *index (uint): Either image coordinates or index
+
+        Returns:
+            np_array: A numpy ND array containing the image
+
+        """
+        return self._request({"op": "frame", "file": fileIndex, "index": [int(ii) for ii in index]})
+
+    def getROI(self, fileIndex, roi, *index):
+        """
+        Returns a rectangular region of a frame
+
+        Args:
+            fileIndex (int): Index of the file on the server
+            roi (tuple): (y0, y1, x0, x1) pixel bounds of the region
+            *index (uint): Either image coordinates or index
+
+        Returns:
+            np_array: A numpy ND array containing the region
+
+        """
+        return self._request({"op": "roi", "file": fileIndex, "index": [int(ii) for ii in index],
+                              "roi": [int(val) for val in roi]})
+
+    def getThumbnail(self, fileIndex, maxSize, *index):
+        """
+        Returns a frame subsampled so that its largest side is at most maxSize
+
+        Args:
+            fileIndex (int): Index of the file on the server
+            maxSize (int): Maximum width or height of the thumbnail
+            *index (uint): Either image coordinates or index
+
+        Returns:
+            np_array: A numpy ND array containing the thumbnail
+
+        """
+        return self._request({"op": "thumbnail", "file": fileIndex, "index": [int(ii) for ii in index],
+                              "maxSize": int(maxSize)})
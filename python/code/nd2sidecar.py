@@ -0,0 +1,96 @@
+""" Sidecar index files for ND2 files
+
+Values which are expensive to compute from an ND2 file (e.g. whole-file statistics or index tables) can be stored in a sidecar file next to the ND2 file so that they do not have to be recomputed the next time the file is opened.
+
+The sidecar is a NumPy .npz archive. It records the size and modification time of the ND2 file it was written for and is ignored if the ND2 file has since changed.
+
+"""
+
+from pathlib import Path
+import os
+import numpy as np
+
+SIDECAR_SUFFIX = ".idx.npz"
+
+def sidecarPath(filepath):
+    """
+    Returns the default sidecar path for an ND2 file
+
+    Args:
+        filepath (str or Path): Path to the ND2 file
+
+    Returns:
+        path (Path): Path to the sidecar file
+
+    """
+    filepath = Path(filepath)
+
+    return filepath.with_name(filepath.name + SIDECAR_SUFFIX)
+
+
+def _fileStamp(filepath):
+    stat = os.stat(str(filepath))
+
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def loadSidecar(filepath, path=None):
+    """
+    Loads the entries stored in the sidecar of an ND2 file
+
+    Args:
+        filepath (str or Path): Path to the ND2 file
+        path (str or Path): Path to the sidecar (default: :func:`sidecarPath`)
+
+    Returns:
+        entries (dict): Arrays stored in the sidecar. Empty if the sidecar does not exist or is out of date.
+
+    """
+    if path is None:
+        path = sidecarPath(filepath)
+
+    if not Path(path).is_file():
+        return {}
+
+    try:
+        with np.load(str(path), allow_pickle=False) as archive:
+            entries = {key: archive[key] for key in archive.files}
+    except (OSError, ValueError):
+        return {}
+
+    stamp = entries.pop("_stamp", None)
+    if stamp is None or not np.array_equal(stamp, _fileStamp(filepath)):
+        return {}
+
+    return entries
+
+
+def saveSidecar(filepath, entries, path=None):
+    """
+    Adds entries to the sidecar of an ND2 file
+
+    Existing entries with other names are kept. The sidecar is written to a temporary file first and then renamed, so readers never see a partially written sidecar.
+
+    Args:
+        filepath (str or Path): Path to the ND2 file
+        entries (dict): Arrays to store
+        path (str or Path): Path to the sidecar (default: :func:`sidecarPath`)
+
+    Returns:
+        None
+
+    """
+    if path is None:
+        path = sidecarPath(filepath)
+    path = Path(path)
+
+    merged = loadSidecar(filepath, path)
+    merged.update(entries)
+    merged["_stamp"] = _fileStamp(filepath)
+
+    tmppath = path.with_name(path.name + ".tmp")
+    with open(str(tmppath), "wb") as fh:
+        np.savez(fh, **merged)
+    os.replace(str(tmppath), str(path))
+
+    return None
@@ -0,0 +1,209 @@
+""" Profiling of read pipelines in Chrome trace format
+
+When tracing is enabled, the readers record a span for each step of reading a frame (e.g. coordinate lookup, SDK decode, copy, transforms and time spent waiting for prefetched data), tagged with the sequence index of the frame. The SDK bindings in :mod:`nd2ReadSDK` are wrapped so that every SDK call is recorded as well. The spans are recorded per thread and can be saved as Chrome trace / Perfetto JSON, which can be opened in chrome://tracing or https://ui.perfetto.dev.
+
+Example::
+
+    with nd2trace.tracing("trace.json"):
+        reader.getImages(range(100), numWorkers=4)
+
+Tracing is disabled by default. While it is disabled, :func:`span` returns a shared no-op context manager and the SDK bindings are not wrapped.
+
+"""
+
+import contextlib
+import threading
+import functools
+import itertools
+import json
+import time
+import os
+
+#SDK functions wrapped while tracing, with the name of the argument used as
+#the sequence index tag (if any)
+SDK_FUNCTIONS = {"Lim_FileOpenForRead": None,
+                 "Lim_FileClose": None,
+                 "Lim_FileGetAttributes": None,
+                 "Lim_FileGetMetadata": None,
+                 "Lim_FileGetExperiment": None,
+                 "Lim_FileGetTextinfo": None,
+                 "Lim_InitPicture": None,
+                 "Lim_DestroyPicture": None,
+                 "Lim_FileGetImageData": 1,
+                 "Lim_FileGetImageRectData": 1,
+                 "Lim_GetSeqIndexFromCoords": None,
+                 "Lim_GetCoordsFromSeqIndex": 1,
+                 "Lim_GetNextUserEvent": None}
+
+_state = {"enabled": False, "patched": {}}
+_events = []
+_threadNames = {}
+_threadIds = itertools.count(1)
+_local = threading.local()
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class _Span:
+
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter_ns()
+
+        #Thread idents are reused after a thread exits, so each thread gets
+        #its own trace id
+        tid = getattr(_local, "tid", None)
+        if tid is None:
+            tid = _local.tid = next(_threadIds)
+            _threadNames[tid] = threading.current_thread().name
+
+        #list.append is atomic, so no lock is needed
+        _events.append((self.name, self.start, end, tid, self.args))
+
+
+def span(name, **args):
+    """
+    Returns a context manager that records a span while tracing is enabled
+
+    Args:
+        name (str): Name of the span
+        **args: Tags shown with the span (e.g. seq_index)
+
+    Returns:
+        context manager
+
+    """
+    if not _state["enabled"]:
+        return _NULL_SPAN
+
+    return _Span(name, args)
+
+
+def _wrapSDKFunction(name, func, seqArg):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if seqArg is not None and len(args) > seqArg:
+            tags = {"seq_index": int(args[seqArg])}
+        else:
+            tags = {}
+
+        with span(name, **tags):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def enable(instrumentSDK=True):
+    """
+    Starts recording spans
+
+    Args:
+        instrumentSDK (bool): Also record calls to the SDK bindings
+
+    Returns:
+        None
+
+    """
+    _state["enabled"] = True
+
+    if instrumentSDK and not _state["patched"]:
+        try:
+            import nd2ReadSDK
+        except OSError:
+            #SDK library not available
+            return
+
+        for name, seqArg in SDK_FUNCTIONS.items():
+            func = getattr(nd2ReadSDK, name, None)
+            if func is not None:
+                _state["patched"][name] = func
+                setattr(nd2ReadSDK, name, _wrapSDKFunction(name, func, seqArg))
+
+
+def disable():
+    """ Stops recording spans and restores the SDK bindings """
+    _state["enabled"] = False
+
+    if _state["patched"]:
+        import nd2ReadSDK
+
+        for name, func in _state["patched"].items():
+            setattr(nd2ReadSDK, name, func)
+        _state["patched"] = {}
+
+
+def isEnabled():
+    """ Returns True while tracing is enabled """
+    return _state["enabled"]
+
+
+def clear():
+    """ Discards all recorded spans """
+    del _events[:]
+
+
+def traceEvents():
+    """
+    Returns the recorded spans as Chrome trace events
+
+    Returns:
+        events (list): Complete ("X") events with timestamps in microseconds, plus thread name metadata events
+
+    """
+    pid = os.getpid()
+    events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+               "args": {"name": name}}
+              for tid, name in list(_threadNames.items())]
+
+    for name, start, end, tid, args in list(_events):
+        events.append({"name": name, "ph": "X", "pid": pid, "tid": tid,
+                       "ts": start / 1e3, "dur": (end - start) / 1e3,
+                       "args": args})
+
+    return events
+
+
+def save(path):
+    """
+    Writes the recorded spans to a Chrome trace / Perfetto JSON file
+
+    Args:
+        path (str or Path): Path of the JSON file
+
+    Returns:
+        None
+
+    """
+    with open(str(path), "w") as fh:
+        json.dump({"traceEvents": traceEvents(), "displayTimeUnit": "ms"}, fh)
+
+
+@contextlib.contextmanager
+def tracing(path=None, instrumentSDK=True):
+    """
+    Records spans within a with block
+
+    Previously recorded spans are discarded when the block is entered.
+
+    Args:
+        path (str or Path): If given, the trace is saved to this file when the block exits
+        instrumentSDK (bool): Also record calls to the SDK bindings
+
+    """
+    clear()
+    enable(instrumentSDK)
+
+    try:
+        yield
+    finally:
+        disable()
+        if path is not None:
+            save(path)
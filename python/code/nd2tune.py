@@ -0,0 +1,285 @@
+""" Calibration of read settings
+
+The best number of read threads, prefetch depth and cache size depend on the compression and size of the frames and on the storage the file is read from. :func:`calibrate` measures these on the actual file in a short run and picks settings that maximize the read throughput within a memory limit::
+
+    with ND2reader("file.nd2") as reader:
+        result = autotune(reader, memoryLimit=2 * 2**30, path="nd2tune.json")
+        settings = result["settings"]
+
+        images = reader.getImages(range(100), numWorkers=settings["numWorkers"])
+
+        numZ = reader.loopSizes[2]
+        for volume, coords in reader.iter_volumes(prefetch=prefetchDepth(settings, numZ)):
+            ...
+
+The prefetch depth is budgeted in frames. Readers that read ahead in larger units take the number of those units that fits in the budget (see :func:`prefetchDepth`), e.g. volumes of numZ frames for :meth:`nd2reader.ND2reader.iter_volumes`, or batches of framesPerBatch frames for :class:`nd2loader.PatchLoader`::
+
+    loader = PatchLoader(paths, framesPerBatch=4, numWorkers=settings["numWorkers"],
+                         prefetch=prefetchDepth(settings, 4), cacheBytes=settings["cacheBytes"])
+
+The cache size can also be passed to :class:`nd2server.FrameServer` (cacheBytes).
+
+Files with the same compression, bit depth, number of channels and frame size are considered to be of the same type (see :func:`fileType`). :func:`autotune` stores the result for each file type in a JSON file and reuses it for other files of that type.
+
+"""
+
+from nd2reader import _memoryLimit, memory_report, _npDtype
+
+from pathlib import Path
+import json
+import time
+import os
+import numpy as np
+
+#Fraction of the best throughput at which fewer workers are preferred
+THROUGHPUT_TOLERANCE = 0.95
+
+DEFAULT_CACHE_BYTES = 256 * 2**20
+
+
+def fileType(reader):
+    """
+    Returns the key under which the settings of a file are stored
+
+    Args:
+        reader (:class:`nd2reader.ND2reader`): Open reader
+
+    Returns:
+        key (str): Compression, bits per component, number of channels and frame size, e.g. "compression0-16bit-2ch-2048x2048"
+
+    """
+    return "compression{}-{}bit-{}ch-{}x{}".format(reader.compression, reader.bitsPerComponent,
+                                                   reader.numChannels, reader.widthPx, reader.heightPx)
+
+
+def _timeFrames(reader, seqIndices):
+    """ Returns the decode and copy time of each frame in seconds """
+    frameReader = None if reader.usesMemmap else reader._openFrameReader()
+    dest = np.empty((reader.heightPx, reader.widthPx, reader.numChannels),
+                    _npDtype(reader.bitsPerComponent))
+    decodeTimes = np.zeros(len(seqIndices))
+    copyTimes = np.empty(len(seqIndices))
+
+    try:
+        for ii, seq_index in enumerate(seqIndices):
+            start = time.perf_counter()
+            if frameReader is None:
+                frame = reader._mmap.frame(int(seq_index))
+            else:
+                frame, _ = frameReader.read(int(seq_index))
+                decodeTimes[ii] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            np.copyto(dest, frame)
+            copyTimes[ii] = time.perf_counter() - start
+    finally:
+        if frameReader is not None:
+            frameReader.close()
+
+    return decodeTimes, copyTimes
+
+
+def _sample(numFramesFile, numFrames, trial, numTrials):
+    """ Returns the sequence indices of the sample read in a trial """
+    seqIndices = np.linspace(0, numFramesFile - 1, min(numFrames, numFramesFile))
+
+    #Each trial reads frames shifted by an equal part of the spacing
+    spacing = numFramesFile / len(seqIndices)
+    offset = int(round(trial * spacing / numTrials))
+
+    return np.unique((seqIndices.astype(np.int64) + offset) % numFramesFile)
+
+
+def prefetchDepth(settings, framesPerItem=1):
+    """
+    Converts the prefetch depth of :func:`calibrate` to the unit of a reader
+
+    Args:
+        settings (dict): Settings returned by :func:`calibrate`
+        framesPerItem (int): Number of frames read per item, e.g. numZ for the volumes of :meth:`nd2reader.ND2reader.iter_volumes` or framesPerBatch for the batches of :class:`nd2loader.PatchLoader`
+
+    Returns:
+        prefetch (int): Number of items read ahead. It is at least 1, even if one item is larger than the prefetch budget.
+
+    """
+    return int(max(1, settings["prefetch"] // max(framesPerItem, 1)))
+
+
+def calibrate(reader, memoryLimit=None, numFrames=32, maxWorkers=None):
+    """
+    Measures the read performance of a file and picks read settings
+
+    A sample of frames spread over the file is read once on a single thread to measure the decode latency and the copy cost per frame. Samples are then read with 1, 2, 4, ... worker threads until the throughput stops improving. The fewest workers that reach :data:`THROUGHPUT_TOLERANCE` of the best throughput are chosen. The prefetch depth covers the spread of the decode latency (p95 / median). Each worker and each prefetched frame needs one frame of memory, and half of the memory left within the limit is given to the cache.
+
+    The worker handles of each measurement are opened before it is timed, like the reader's own handle used with one worker. Within the memory limit, the samples are read through a buffer that takes at most half of the available memory, leaving the rest for the picture buffers of the workers.
+
+    Each measurement reads a different sample, shifted within the spacing of the frames, so that frames cached by the operating system during an earlier measurement do not inflate the throughput of a later one. Files with fewer frames than numFrames times the number of measurements cannot give every measurement new frames, and some frames are read again.
+
+    Args:
+        reader (:class:`nd2reader.ND2reader`): Open reader
+        memoryLimit (int): Memory available to the reader in bytes, including what readers already hold (default: the limit set with :func:`nd2reader.set_memory_limit`, if any)
+        numFrames (int): Number of frames in the sample
+        maxWorkers (int): Largest number of workers tried (default: CPU count)
+
+    Returns:
+        result (dict):
+            fileType: See :func:`fileType`
+            settings: numWorkers, prefetch (in frames, see :func:`prefetchDepth`) and cacheBytes
+            measurements: frameBytes, decodeMs (median and p95), copyMs (median), copyGBps and framesPerSecond for each number of workers tried
+
+    """
+    reader._checkOpen()
+
+    if memoryLimit is None:
+        memoryLimit = _memoryLimit["limit"]
+    if maxWorkers is None:
+        maxWorkers = os.cpu_count() or 1
+
+    frameBytes = (reader.heightPx * reader.widthPx * reader.numChannels
+                  * np.dtype(_npDtype(reader.bitsPerComponent)).itemsize)
+
+    #The latency measurement and at most one read per number of workers
+    numTrials = int(np.log2(max(maxWorkers, 1))) + 2
+    seqIndices = _sample(reader.numFrames, numFrames, 0, numTrials)
+
+    decodeTimes, copyTimes = _timeFrames(reader, seqIndices)
+    decodeMedian = float(np.median(decodeTimes))
+    decodeP95 = float(np.percentile(decodeTimes, 95))
+    copyMedian = float(np.median(copyTimes))
+
+    available = None
+    if memoryLimit is not None:
+        available = max(memoryLimit - memory_report()["total"], 0)
+
+    #The samples are read in parts if they do not fit in half of the memory
+    bufferFrames = len(seqIndices)
+    if available is not None:
+        bufferFrames = int(max(1, min(bufferFrames, available // frameBytes // 2)))
+    out = np.empty((bufferFrames, reader.heightPx, reader.widthPx, reader.numChannels),
+                   _npDtype(reader.bitsPerComponent))
+
+    throughput = {}
+    numWorkers = 1
+    trial = 1
+    while numWorkers <= maxWorkers:
+        #Each worker borrows a picture buffer
+        if (available is not None and numWorkers > 1
+                and (numWorkers + bufferFrames) * frameBytes > available):
+            break
+
+        trialIndices = _sample(reader.numFrames, numFrames, trial, numTrials)
+        trial += 1
+
+        #Opening the worker handles is not part of the measurement
+        pool = reader._openReaderPool(numWorkers)
+        try:
+            start = time.perf_counter()
+            for first in range(0, len(trialIndices), bufferFrames):
+                part = trialIndices[first:first + bufferFrames]
+                reader._readInto(out[:len(part)], part, numWorkers=numWorkers, pool=pool)
+            throughput[numWorkers] = len(trialIndices) / max(time.perf_counter() - start, 1e-9)
+        finally:
+            if pool is not None:
+                pool.close()
+
+        if numWorkers > 1 and throughput[numWorkers] < 1.1 * max(throughput[w] for w in throughput if w < numWorkers):
+            break
+        numWorkers *= 2
+
+    best = max(throughput.values())
+    numWorkers = min(w for w, fps in throughput.items() if fps >= THROUGHPUT_TOLERANCE * best)
+
+    if decodeMedian > 0:
+        prefetch = int(np.ceil(decodeP95 / decodeMedian))
+    else:
+        prefetch = 1
+
+    if available is None:
+        cacheBytes = DEFAULT_CACHE_BYTES
+    else:
+        prefetch = int(max(1, min(prefetch, available // frameBytes - numWorkers)))
+        cacheBytes = int(max(available - (numWorkers + prefetch) * frameBytes, 0) // 2)
+
+    return {"fileType": fileType(reader),
+            "settings": {"numWorkers": numWorkers,
+                         "prefetch": prefetch,
+                         "cacheBytes": cacheBytes},
+            "measurements": {"frameBytes": frameBytes,
+                             "numFrames": len(seqIndices),
+                             "decodeMs": {"median": 1e3 * decodeMedian, "p95": 1e3 * decodeP95},
+                             "copyMs": 1e3 * copyMedian,
+                             "copyGBps": frameBytes / max(copyMedian, 1e-12) / 1e9,
+                             "framesPerSecond": {str(w): fps for w, fps in throughput.items()},
+                             "memoryLimit": memoryLimit}}
+
+
+def loadSettings(path):
+    """
+    Loads stored calibration results
+
+    Args:
+        path (str or Path): Path to the JSON file
+
+    Returns:
+        results (dict): Results of :func:`calibrate` keyed by file type. Empty if the file does not exist.
+
+    """
+    path = Path(path)
+    if not path.is_file():
+        return {}
+
+    with open(str(path)) as fh:
+        return json.load(fh)
+
+
+def saveSettings(path, result):
+    """
+    Stores a calibration result under its file type
+
+    Results for other file types are kept. The file is written to a temporary file first and then renamed.
+
+    Args:
+        path (str or Path): Path to the JSON file
+        result (dict): Result of :func:`calibrate`
+
+    Returns:
+        None
+
+    """
+    path = Path(path)
+    results = loadSettings(path)
+    results[result["fileType"]] = result
+
+    tmpPath = Path(str(path) + ".tmp")
+    with open(str(tmpPath), "w") as fh:
+        json.dump(results, fh, indent=2)
+    os.replace(str(tmpPath), str(path))
+
+
+def autotune(reader, memoryLimit=None, path=None, recalibrate=False, **kwargs):
+    """
+    Returns read settings for a file, calibrating only if needed
+
+    Args:
+        reader (:class:`nd2reader.ND2reader`): Open reader
+        memoryLimit (int): Memory limit in bytes (see :func:`calibrate`)
+        path (str or Path): JSON file with stored results (optional). A stored result for the same file type and memory limit is reused, and new results are added to the file.
+        recalibrate (bool): Calibrate even if a stored result exists
+        **kwargs: Passed to :func:`calibrate`
+
+    Returns:
+        result (dict): See :func:`calibrate`
+
+    """
+    if path is not None and not recalibrate:
+        stored = loadSettings(path).get(fileType(reader))
+        if stored is not None and stored["measurements"]["memoryLimit"] == (
+                memoryLimit if memoryLimit is not None else _memoryLimit["limit"]):
+            return stored
+
+    result = calibrate(reader, memoryLimit, **kwargs)
+
+    if path is not None:
+        saveSettings(path, result)
+
+    return result
@@ -0,0 +1,83 @@
+import unittest
+from nd2broker import FrameBroker
+from nd2reader import ND2reader, memory_report
+from pathlib import Path
+import numpy as np
+
+class TestFrameBroker(unittest.TestCase):
+
+    test_file = Path(__file__) / ".." / ".." / ".." / "sampleND2" / "sampleND2.nd2"
+
+    def setUp(self):
+        self.broker = FrameBroker(str(self.test_file.resolve()), numClients=1, numSlots=2)
+        self.client = self.broker.client(0)
+
+    def tearDown(self):
+        self.client.close()
+        self.broker.close()
+
+    def test_getFrame(self):
+
+        with ND2reader(str(self.test_file.resolve())) as reader:
+            expected = reader.getImage(1)
+
+        with self.client.getFrame(1, timeout=10) as frame:
+            self.assertTrue(np.array_equal(frame.array, expected))
+
+    def test_shared_slot(self):
+
+        first = self.client.getFrame(0, timeout=10)
+        second = self.client.getFrame(0, timeout=10)
+
+        self.assertTrue(np.shares_memory(first.array, second.array))
+
+        first.release()
+        second.release()
+
+    def test_memory_report(self):
+
+        frameBytes = int(np.prod(self.broker.frameShape)) * self.broker.dtype.itemsize
+
+        self.assertGreaterEqual(memory_report()["sharedMemory"], 2 * frameBytes)
+
+    def test_broker_failed(self):
+
+        #An invalid message makes the broker process fail
+        self.broker._requests.put(("release", self.broker.numSlots))
+
+        with self.assertRaises(RuntimeError):
+            self.client.getFrame(0)
+
+    def test_broker_killed(self):
+
+        self.broker._process.kill()
+        self.broker._process.join()
+
+        with self.assertRaises(RuntimeError):
+            self.client.getFrame(0)
+
+    def test_timeout(self):
+
+        held = [self.client.getFrame(0, timeout=10), self.client.getFrame(1, timeout=10)]
+
+        #All slots are in use, so the request waits until it times out
+        with self.assertRaises(TimeoutError):
+            self.client.getFrame(2, timeout=0.1)
+
+        for frame in held:
+            frame.release()
+
+        with ND2reader(str(self.test_file.resolve())) as reader:
+            expected = reader.getImage(3)
+
+        #The late reply for frame 2 is discarded and its slot released
+        with self.client.getFrame(3, timeout=10) as frame:
+            self.assertEqual(frame.seq_index, 3)
+            self.assertTrue(np.array_equal(frame.array, expected))
+
+            with self.client.getFrame(4, timeout=10) as other:
+                self.assertEqual(other.seq_index, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+from nd2cache import FrameCache
+from nd2reader import memory_report
+import numpy as np
+
+class TestFrameCache(unittest.TestCase):
+
+    def test_lru(self):
+
+        cache = FrameCache(3 * 100)
+        for key in range(3):
+            cache.put(key, np.zeros(100, np.uint8))
+
+        #Reading a frame makes it the most recently used
+        self.assertIsNotNone(cache.get(0))
+        cache.put(3, np.zeros(100, np.uint8))
+
+        self.assertIsNone(cache.get(1))
+        self.assertIsNotNone(cache.get(0))
+        self.assertEqual(cache.numBytes, 300)
+
+    def test_too_large(self):
+
+        cache = FrameCache(10)
+        cache.put(0, np.zeros(11, np.uint8))
+
+        self.assertIsNone(cache.get(0))
+        self.assertEqual(cache.numBytes, 0)
+
+    def test_memory_report(self):
+
+        cache = FrameCache(1000)
+        before = memory_report()["frameCaches"]
+        cache.put(0, np.zeros(100, np.uint8))
+
+        self.assertEqual(memory_report()["frameCaches"], before + 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
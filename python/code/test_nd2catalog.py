@@ -0,0 +1,61 @@
+import unittest
+from nd2catalog import ND2Catalog
+from pathlib import Path
+import tempfile
+
+class TestND2Catalog(unittest.TestCase):
+
+    test_file = Path(__file__) / ".." / ".." / ".." / "sampleND2" / "sampleND2.nd2"
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.catalog = ND2Catalog(Path(self._tmpdir.name) / "catalog.sqlite")
+
+    def tearDown(self):
+        self.catalog.close()
+        self._tmpdir.cleanup()
+
+    def test_update(self):
+
+        counts = self.catalog.update([self.test_file.resolve()], jobs=1)
+        self.assertEqual(counts["scanned"], 1)
+        self.assertEqual(counts["failed"], 0)
+
+        #Unchanged files are not scanned again
+        counts = self.catalog.update([self.test_file.resolve()], jobs=1)
+        self.assertEqual(counts["scanned"], 0)
+        self.assertEqual(counts["unchanged"], 1)
+
+    def test_query(self):
+
+        self.catalog.update([self.test_file.resolve()], jobs=1)
+        info = self.catalog.info(self.test_file.resolve())
+
+        rows = self.catalog.query("numChannels = ? AND numFrames = ?",
+                                  (info["numChannels"], info["numFrames"]))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["widthPx"], info["widthPx"])
+
+        self.assertEqual(self.catalog.query("numChannels > ?", (info["numChannels"],)), [])
+
+    def test_unreadable(self):
+
+        path = Path(self._tmpdir.name) / "broken.nd2"
+        path.write_bytes(b"not an ND2 file")
+
+        counts = self.catalog.updateDirectory(self._tmpdir.name, jobs=1)
+        self.assertEqual(counts["failed"], 1)
+        self.assertEqual(self.catalog.query(), [])
+        self.assertEqual(len(self.catalog.query(includeErrors=True)), 1)
+
+        with self.assertRaises(KeyError):
+            self.catalog.info(path)
+
+        #Removed files are pruned
+        path.unlink()
+        self.assertEqual(self.catalog.updateDirectory(self._tmpdir.name, jobs=1)["removed"], 1)
+        self.assertEqual(len(self.catalog), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+from unittest import mock
+import nd2cli
+from nd2reader import ND2reader
+from pathlib import Path
+import tempfile
+import numpy as np
+
+class _TruncatedReader(ND2reader):
+    """ Reader of a file whose last frame has not been acquired """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.numFrames -= 1
+
+
+class TestND2CLI(unittest.TestCase):
+
+    test_file = Path(__file__) / ".." / ".." / ".." / "sampleND2" / "sampleND2.nd2"
+
+    def test_convert(self):
+
+        with tempfile.TemporaryDirectory() as outdir:
+            pathOut = Path(outdir) / "sampleND2.npy"
+            nd2cli.convertFile(self.test_file.resolve(), pathOut, max_bytes=1)
+
+            converted = np.load(str(pathOut))
+
+        with ND2reader(str(self.test_file.resolve())) as reader:
+            self.assertEqual(len(converted), reader.numFrames)
+            self.assertTrue(np.array_equal(converted[1], reader.getImage(1)))
+
+    def test_convert_error(self):
+
+        with tempfile.TemporaryDirectory() as outdir:
+            pathOut = Path(outdir) / "sampleND2.npy"
+
+            with mock.patch.object(ND2reader, "_readInto", side_effect=RuntimeError("read failed")):
+                self.assertRaises(RuntimeError, nd2cli.convertFile, self.test_file.resolve(), pathOut)
+
+            #The temporary output is removed
+            self.assertEqual(list(Path(outdir).iterdir()), [])
+
+    def test_convert_order(self):
+
+        with ND2reader(str(self.test_file.resolve())) as reader:
+            #Position-major order of the axes that are present
+            sizes = reader.loopSizes
+            order = "".join(axis for axis in "PTZO" if sizes["TPZO".index(axis)] > 1) or "T"
+
+            with tempfile.TemporaryDirectory() as outdir:
+                pathOut = Path(outdir) / "sampleND2.npy"
+                numFrames = nd2cli.convertFile(self.test_file.resolve(), pathOut, max_bytes=1,
+                                               order=order, numWorkers=2)
+
+                converted = np.load(str(pathOut))
+
+            self.assertEqual(numFrames, reader.numFrames)
+            self.assertEqual(converted.shape[:len(order)],
+                             tuple(sizes["TPZO".index(axis)] for axis in order))
+
+            #The last frame of the output is the frame with the last coordinates
+            coords = [0, 0, 0, 0]
+            for axis in order:
+                coords["TPZO".index(axis)] = sizes["TPZO".index(axis)] - 1
+            self.assertTrue(np.array_equal(converted.reshape((-1,) + converted.shape[len(order):])[-1],
+                                           reader.getImage(*coords)))
+
+    def test_convert_order_truncated(self):
+
+        with ND2reader(str(self.test_file.resolve())) as reader:
+            numFrames = reader.numFrames
+            sizes = reader.loopSizes
+        order = "".join(axis for axis in "PTZO" if sizes["TPZO".index(axis)] > 1) or "T"
+
+        with tempfile.TemporaryDirectory() as outdir:
+            pathOut = Path(outdir) / "sampleND2.npy"
+            with mock.patch.object(nd2cli, "ND2reader", _TruncatedReader):
+                numWritten = nd2cli.convertFile(self.test_file.resolve(), pathOut, max_bytes=1, order=order)
+
+            converted = np.load(str(pathOut))
+
+        #The frame that was not acquired is left as zeros
+        self.assertEqual(numWritten, numFrames - 1)
+        flat = converted.reshape((-1,) + converted.shape[len(order):])
+        self.assertEqual(int((flat.reshape(len(flat), -1) == 0).all(axis=1).sum()), len(flat) - numWritten)
+
+    def test_benchmark(self):
+
+        results = nd2cli.benchmark(self.test_file.resolve(), numFrames=5, jobs=2)
+
+        self.assertGreater(results["sequentialFps"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
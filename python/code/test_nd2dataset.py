@@ -0,0 +1,78 @@
+import unittest
+from unittest import mock
+import nd2dataset
+from nd2dataset import ND2Dataset
+from nd2reader import ND2reader
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+class TestND2Dataset(unittest.TestCase):
+
+    test_file = Path(__file__) / ".." / ".." / ".." / "sampleND2" / "sampleND2.nd2"
+
+    def setUp(self):
+        self.dataset = ND2Dataset([self.test_file.resolve()] * 3, maxOpen=2)
+
+    def tearDown(self):
+        self.dataset.close()
+
+    def test_locate(self):
+
+        framesPerFile = self.dataset.numFrames(0)
+
+        self.assertEqual(len(self.dataset), 3 * framesPerFile)
+        self.assertEqual(self.dataset.locate(framesPerFile + 1), (1, 1))
+
+    def test_maxOpen(self):
+
+        for fileIndex in range(3):
+            self.dataset.getImage(fileIndex, 0)
+
+        self.assertEqual(self.dataset.numOpen, 2)
+
+    def test_concurrent_eviction(self):
+
+        dataset = ND2Dataset([self.test_file.resolve()] * 3, maxOpen=1)
+
+        def read(ii):
+            return dataset.getImage(ii % 3, 0).shape
+
+        try:
+            with ThreadPoolExecutor(6) as executor:
+                shapes = list(executor.map(read, range(300)))
+        finally:
+            dataset.close()
+
+        self.assertEqual(len(set(shapes)), 1)
+
+    def test_open_outside_lock(self):
+
+        self.dataset.getImage(0, 0)
+        opening = threading.Event()
+        proceed = threading.Event()
+
+        def slowOpen(path):
+            opening.set()
+            proceed.wait(10)
+            return ND2reader(path)
+
+        with mock.patch.object(nd2dataset, "ND2reader", side_effect=slowOpen):
+            opener = threading.Thread(target=self.dataset.getImage, args=(1, 0))
+            opener.start()
+            opening.wait(10)
+
+            #An open file can be read while another file is being opened
+            reader = threading.Thread(target=self.dataset.getImage, args=(0, 0))
+            reader.start()
+            reader.join(5)
+            self.assertFalse(reader.is_alive())
+
+            proceed.set()
+            opener.join()
+
+        self.assertEqual(self.dataset.numOpen, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
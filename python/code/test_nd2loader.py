@@ -0,0 +1,68 @@
+import unittest
+from nd2loader import PatchLoader
+from nd2reader import ND2reader
+from pathlib import Path
+import numpy as np
+
+class TestND2Loader(unittest.TestCase):
+
+    test_file = Path(__file__) / ".." / ".." / ".." / "sampleND2" / "sampleND2.nd2"
+
+    def _loader(self, **kwargs):
+        return PatchLoader([str(self.test_file.resolve())], patchSize=16, batchSize=8,
+                           framesPerBatch=2, seed=1, **kwargs)
+
+    def test_patches(self):
+
+        with self._loader() as loader:
+            patches, samples = loader.getBatch(0)
+
+        self.assertEqual(patches.shape[:3], (8, 16, 16))
+
+        with ND2reader(str(self.test_file.resolve())) as reader:
+            for patch, sample in zip(patches, samples):
+                frame = reader.getImage(int(sample["seq_index"]))
+                self.assertTrue(np.array_equal(patch, frame[sample["y"]:sample["y"] + 16,
+                                                             sample["x"]:sample["x"] + 16]))
+
+        #Each batch takes its patches from framesPerBatch frames
+        self.assertEqual(len(set(samples["seq_index"].tolist())), 2)
+
+    def test_deterministic(self):
+
+        #Region reads and full-frame reads give the same batches
+        with self._loader(roiFraction=0) as loader:
+            batches = list(loader)
+        with self._loader(roiFraction=1, numWorkers=2) as loader:
+            batchesROI = list(loader)
+
+        self.assertEqual(len(batches), len(batchesROI))
+        for (patches, samples), (patchesROI, samplesROI) in zip(batches, batchesROI):
+            self.assertTrue(np.array_equal(samples, samplesROI))
+            self.assertTrue(np.array_equal(patches, patchesROI))
+
+    def test_worker_datasets(self):
+
+        #Threads reading at the same time do not share file handles
+        with self._loader(numWorkers=2) as loader:
+            first = loader._borrowDataset()
+            second = loader._borrowDataset()
+            self.assertIsNot(first, second)
+            loader._returnDataset(first)
+            loader._returnDataset(second)
+            third = loader._borrowDataset()
+            loader._returnDataset(third)
+            self.assertIs(third, second)
+
+    def test_shards(self):
+
+        frames = []
+        for shardIndex in range(2):
+            with self._loader(shardIndex=shardIndex, numShards=2) as loader:
+                frames.append({int(seq_index) for _, samples in loader for seq_index in samples["seq_index"]})
+
+        self.assertEqual(frames[0] & frames[1], set())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import nd2mmap
+from pathlib import Path
+import tempfile
+import struct
+import numpy as np
+
+def _chunk(name, data):
+    return struct.pack("<IIQ", nd2mmap.CHUNK_MAGIC, len(name), len(data)) + name + data
+
+def _item(itemType, name, payload):
+    name = (name + "\x00").encode("utf-16-le")
+    return struct.pack("<BB", itemType, len(name) // 2) + name + payload
+
+def writeTestFile(path, frames, compression=2, rowPadding=4):
+    """ Writes a minimal uncompressed version 3 ND2 file """
+    numFrames, height, width, numComp = frames.shape
+
+    items = [_item(3, "uiWidth", struct.pack("<I", width)),
+             _item(3, "uiWidthBytes", struct.pack("<I", width * numComp * 2 + rowPadding)),
+             _item(3, "uiHeight", struct.pack("<I", height)),
+             _item(3, "uiComp", struct.pack("<I", numComp)),
+             _item(3, "uiBpcInMemory", struct.pack("<I", 16)),
+             _item(3, "uiSequenceCount", struct.pack("<I", numFrames)),
+             _item(2, "eCompression", struct.pack("<i", compression)),
+             _item(8, "wsName", "test\x00".encode("utf-16-le"))]
+    attributes = _item(11, "SLxImageAttributes", struct.pack("<IQ", len(items), 0)
+                       + b"".join(items) + bytes(8 * len(items)))
+
+    contents = bytearray(_chunk(b"ND2 FILE SIGNATURE CHUNK NAME01!", b"Ver3.0"))
+    chunkMap = []
+
+    def addChunk(name, data):
+        chunkMap.append(name + struct.pack("<QQ", len(contents), len(data)))
+        contents.extend(_chunk(name, data))
+
+    addChunk(b"ImageAttributesLV!", attributes)
+    for seq_index, frame in enumerate(frames):
+        rows = np.concatenate([frame.astype("<u2").reshape(height, -1).view(np.uint8),
+                               np.zeros((height, rowPadding), np.uint8)], axis=1)
+        addChunk("ImageDataSeq|{}!".format(seq_index).encode("ascii"),
+                 struct.pack("<d", 100.0 * seq_index) + rows.tobytes())
+
+    mapOffset = len(contents)
+    contents.extend(_chunk(nd2mmap.FILEMAP_NAME,
+                           b"".join(chunkMap) + nd2mmap.CHUNK_MAP_SIGNATURE))
+    contents.extend(nd2mmap.CHUNK_MAP_SIGNATURE + struct.pack("<Q", mapOffset))
+
+    with open(str(path), "wb") as fh:
+        fh.write(contents)
+
+class TestND2Memmap(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.frames = np.arange(3 * 5 * 7 * 2, dtype=np.uint16).reshape(3, 5, 7, 2)
+        self.path = Path(self.tmpdir.name) / "test.nd2"
+        writeTestFile(self.path, self.frames)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_frame(self):
+
+        mm = nd2mmap.ND2Memmap(self.path)
+
+        self.assertEqual(mm.numFrames, 3)
+        self.assertTrue(np.array_equal(mm.frame(2), self.frames[2]))
+        self.assertFalse(mm.frame(0).flags.writeable)
+        self.assertEqual(mm.frameTime(1), 100.0)
+
+    def test_compressed(self):
+
+        writeTestFile(self.path, self.frames, compression=0)
+
+        self.assertRaises(nd2mmap.UnsupportedFileError, nd2mmap.ND2Memmap, self.path)
+
+    def test_not_nd2(self):
+
+        with open(str(self.path), "wb") as fh:
+            fh.write(bytes(100))
+
+        self.assertRaises(nd2mmap.UnsupportedFileError, nd2mmap.ND2Memmap, self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,10 @@
 import unittest
-from nd2reader import ND2reader
+from unittest import mock
+from nd2reader import ND2reader, memory_report
+import nd2trace
 from pathlib import Path
 from matplotlib import pyplot as plt
+import numpy as np
 
 class TestND2Reader(unittest.TestCase):
 
@@ -25,6 +28,197 @@ class TestND2Reader(unittest.TestCase):
         plt.imshow(im[:,:,0])
         plt.show()
 
+    def test_channel_stats(self):
+
+        stats = self.reader.channel_stats(bins=64)
+
+        self.assertEqual(stats["histogram"].shape, (self.reader.numChannels, 64))
+        self.assertTrue((stats["min"] <= stats["max"]).all())
+
+    def test_channel_stats_empty(self):
+
+        #A file without acquired frames gives empty statistics
+        self.reader.numFrames = 0
+        stats = self.reader.channel_stats(bins=64)
+
+        self.assertEqual(stats["framesSampled"], 0)
+        self.assertEqual(stats["histogram"].sum(), 0)
+        self.assertTrue((stats["percentiles"] == 0).all())
+
+    def test_close(self):
+
+        with ND2reader(str(self.test_file.resolve())) as reader:
+            reader.getImage(0)
+
+        self.assertTrue(reader.closed)
+        self.assertRaises(ValueError, reader.getImage, 0)
+
+    def test_follow(self):
+
+        indices = [seq_index for seq_index, _ in self.reader.follow(pollInterval=0.01,
+                                                                    idleTimeout=0.05)]
+
+        self.assertEqual(indices, list(range(self.reader.numFrames)))
+
+    def test_getImages(self):
+
+        images = self.reader.getImages([1, 0, 1])
+
+        self.assertEqual(images.shape[0], 3)
+        self.assertTrue((images[0] == self.reader.getImage(1)).all())
+        self.assertTrue((images[0] == images[2]).all())
+
+    def test_frames_between(self):
+
+        times = self.reader.getFrameTimes()
+        seqIndices = self.reader.frames_between(times.min(), times.max())
+
+        self.assertEqual(len(seqIndices), self.reader.numFrames)
+        self.assertEqual(self.reader.nearest_frame(times[3]), 3)
+
+    def test_getFrameTimes_memmap(self):
+
+        #Memory-mapped files read the times without the SDK
+        with ND2reader(str(self.test_file.resolve()), memmap=False) as reader:
+            expected = reader.getFrameTimes()
+
+        self.assertTrue(np.array_equal(self.reader.getFrameTimes(), expected))
+
+    def test_iter_chunks(self):
+
+        frameBytes = self.reader.getImage(0).nbytes
+        numFrames = 0
+
+        for block, coords in self.reader.iter_chunks("T", max_bytes=2 * frameBytes):
+            self.assertLessEqual(block.nbytes, 2 * frameBytes)
+            self.assertEqual(len(block), len(coords))
+            numFrames += len(block)
+
+        self.assertEqual(numFrames, self.reader.loopSizes[0])
+
+    def test_iter_chunks_truncated(self):
+
+        #Frames beyond numFrames have not been acquired
+        self.reader.numFrames -= 1
+        seqIndices = [self.reader.getSeqIndex(*frameCoords) for _, coords in self.reader.iter_chunks("TPZO")
+                      for frameCoords in coords.tolist()]
+
+        self.assertEqual(sorted(seqIndices), list(range(self.reader.numFrames)))
+
+    def test_iter_volumes_truncated(self):
+
+        numZ = self.reader.loopSizes[2]
+        numVolumes = len(list(self.reader.iter_volumes("TPO")))
+
+        #The volume with the missing plane is skipped
+        self.reader.numFrames -= 1
+        volumes = [coords for _, coords in self.reader.iter_volumes("TPO")]
+
+        self.assertEqual(len(volumes), numVolumes - 1)
+        for coords in volumes:
+            self.assertEqual(len(coords), numZ)
+
+    def test_iter_chunks_workers(self):
+
+        with ND2reader(str(self.test_file.resolve()), memmap=False) as reader:
+            frameBytes = reader.getImage(0).nbytes
+
+            with mock.patch.object(reader, "_openFrameReader", wraps=reader._openFrameReader) as opened:
+                chunks = [(block.copy(), coords) for block, coords in reader.iter_chunks(
+                    "T", max_bytes=2 * frameBytes, numWorkers=2)]
+
+            blocks = [block for block, _ in chunks]
+            expected = [reader.getImage(*frameCoords) for _, coords in chunks for frameCoords in coords.tolist()]
+
+        #The worker handles are opened once for the whole iteration
+        self.assertEqual(opened.call_count, 2)
+        self.assertTrue(np.array_equal(np.concatenate(blocks), expected))
+
+    def test_getImage_normalize(self):
+
+        im = self.reader.getImage(0, normalize="bits")
+
+        self.assertEqual(im.dtype, np.float32)
+        self.assertLessEqual(im.max(), 1.0)
+
+    def test_getImage_normalize_integer(self):
+
+        frame = self.reader.getImage(0).astype(np.float64)
+
+        #Values are rounded and clipped to the range of the output type
+        im = self.reader.getImage(0, dtype=np.uint8, normalize=(0, 0.3))
+        self.assertTrue(np.array_equal(im, np.clip(np.rint(frame * 0.3), 0, 255)))
+
+        im = self.reader.getImage(0, dtype=np.uint8, normalize=(frame.max() + 1, 1))
+        self.assertEqual(im.max(), 0)
+
+    def test_transforms(self):
+
+        numCalls = []
+
+        def count(frame):
+            numCalls.append(1)
+
+        self.reader.addTransform(count)
+        self.reader.addTransform(lambda frame: frame[:10, :20],
+                                 outputShape=(10, 20, self.reader.numChannels))
+        images = self.reader.getImages([0, 1, 2], numWorkers=2)
+        self.reader.clearTransforms()
+
+        #Transforms are only called with frames read from the file
+        self.assertEqual(len(numCalls), 3)
+        self.assertEqual(images.shape[1:3], (10, 20))
+        self.assertTrue((images[1] == self.reader.getImage(1)[:10, :20]).all())
+
+        self.reader.addTransform(lambda frame: frame[:10, :20])
+        self.assertRaises(ValueError, self.reader.getImages, [0])
+        self.reader.clearTransforms()
+
+    def test_iter_volumes(self):
+
+        numZ = self.reader.loopSizes[2]
+
+        for volume, coords in self.reader.iter_volumes("TP", prefetch=1):
+            self.assertEqual(volume.shape[0], numZ)
+            self.assertTrue((volume[-1] == self.reader.getImage(*coords[-1])).all())
+
+    def test_memory_report(self):
+
+        self.reader.channel_stats()
+        report = self.reader.memory_report()
+
+        self.assertGreater(report["caches"], 0)
+        self.assertGreaterEqual(memory_report()["total"], report["caches"])
+
+    def test_getROI(self):
+
+        im = self.reader.getImage(1)
+        roi = self.reader.getROI((2, 12, 3, 20), 1)
+
+        self.assertTrue(np.array_equal(roi, im[2:12, 3:20]))
+
+        with self.assertRaises(ValueError):
+            self.reader.getROI((0, self.reader.heightPx + 1, 0, 10), 1)
+
+    def test_getEvents(self):
+
+        events = self.reader.getEvents()
+        windows = self.reader.eventFrames(before=1, after=2)
+
+        self.assertEqual(windows.shape, (len(events), 4))
+        self.assertTrue(np.array_equal(windows[:, 1], events["seq_index"]))
+
+    def test_trace(self):
+
+        with nd2trace.tracing():
+            self.reader.getImages(range(4), numWorkers=2)
+
+        spans = [ev for ev in nd2trace.traceEvents() if ev["ph"] == "X"]
+        decoded = [ev["args"]["seq_index"] for ev in spans if ev["name"] == "Lim_FileGetImageData"]
+
+        self.assertEqual(sorted(decoded), [0, 1, 2, 3])
+        self.assertEqual(len([ev for ev in spans if ev["name"] == "copy"]), 4)
+
      
 
 
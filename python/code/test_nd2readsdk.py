@@ -87,6 +87,38 @@ class TestND2ReadSDK(unittest.TestCase):
                           nd2api.Lim_GetSeqIndexFromCoords,
                           self._fh, 9, 2)
 
+    def test_Lim_GetCoordsFromSeqIndex(self):
+
+        expmd = nd2api.Lim_FileGetExperiment(self._fh)
+
+        seq_index = nd2api.Lim_GetSeqIndexFromCoords(expmd, 4, 0)
+        coords = nd2api.Lim_GetCoordsFromSeqIndex(expmd, seq_index)
+
+        self.assertEqual(coords[:2], [4, 0])
+
+    def test_Lim_GetZStackHome(self):
+
+        z_home = nd2api.Lim_GetZStackHome(self._fh)
+
+        self.assertGreaterEqual(z_home, 0)
+
+    def test_Lim_GetNextUserEvent(self):
+
+        event, next_id = nd2api.Lim_GetNextUserEvent(self._fh)
+
+        if event is not None:
+            self.assertGreaterEqual(event.dTime, 0)
+
+    def test_Lim_FileGetImageRectData(self):
+
+        attr = nd2api.Lim_FileGetAttributes(self._fh)
+        region = np.zeros((10, 20, attr.uiComp), np.uint16)
+
+        nd2api.Lim_FileGetImageRectData(self._fh, 0, attr.uiWidth, attr.uiHeight, 5, 2, 20, 10,
+                                        region.ctypes.data, region.strides[0])
+
+        self.assertTrue(region.any())
+
     def test_Lim_FileGetBinaryDescriptors(self):
 
         binaries = nd2api.Lim_FileGetBinaryDescriptors(self._fh)
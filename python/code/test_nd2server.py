@@ -0,0 +1,48 @@
+import unittest
+from unittest import mock
+import nd2server
+from nd2server import FrameServer, FrameServerClient
+from nd2reader import ND2reader
+from pathlib import Path
+import numpy as np
+
+class TestFrameServer(unittest.TestCase):
+
+    test_file = Path(__file__) / ".." / ".." / ".." / "sampleND2" / "sampleND2.nd2"
+
+    def setUp(self):
+        self.server = FrameServer([self.test_file.resolve()], ("127.0.0.1", 0)).start()
+        self.client = FrameServerClient(self.server.address, timeout=10)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+
+    def test_getImage(self):
+
+        with ND2reader(str(self.test_file.resolve())) as reader:
+            expected = reader.getImage(0)
+
+        self.assertTrue(np.array_equal(self.client.getImage(0, 0), expected))
+        self.assertTrue(np.array_equal(self.client.getROI(0, (0, 10, 5, 20), 0),
+                                       expected[0:10, 5:20]))
+
+    def test_info(self):
+
+        info = self.client.info(0)
+
+        self.assertGreater(info["numFrames"], 0)
+
+    def test_error(self):
+
+        self.assertRaises(RuntimeError, self.client.getImage, 0, 2**31)
+
+    def test_no_unix_sockets(self):
+
+        with mock.patch.object(nd2server, "HAS_UNIX_SOCKETS", False):
+            self.assertRaises(ValueError, FrameServerClient, "frames.sock")
+            self.assertRaises(ValueError, FrameServer, [self.test_file.resolve()], "frames.sock")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import nd2trace
+from pathlib import Path
+import threading
+import tempfile
+import json
+
+class TestND2Trace(unittest.TestCase):
+
+    def tearDown(self):
+        nd2trace.disable()
+        nd2trace.clear()
+
+    def test_disabled(self):
+
+        nd2trace.clear()
+        with nd2trace.span("read", seq_index=0):
+            pass
+
+        self.assertFalse(nd2trace.isEnabled())
+        self.assertEqual([ev for ev in nd2trace.traceEvents() if ev["ph"] == "X"], [])
+
+    def test_threads(self):
+
+        def work(seq_index):
+            with nd2trace.span("read", seq_index=seq_index):
+                with nd2trace.span("copy", seq_index=seq_index):
+                    pass
+
+        with nd2trace.tracing(instrumentSDK=False):
+            threads = [threading.Thread(target=work, args=(ii,), name="worker{}".format(ii))
+                       for ii in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        events = nd2trace.traceEvents()
+        spans = [ev for ev in events if ev["ph"] == "X"]
+        names = {ev["args"]["name"] for ev in events if ev["ph"] == "M"}
+
+        self.assertEqual(len(spans), 6)
+        self.assertEqual(sorted(ev["args"]["seq_index"] for ev in spans if ev["name"] == "read"), [0, 1, 2])
+        self.assertEqual(len({ev["tid"] for ev in spans}), 3)
+        self.assertTrue({"worker0", "worker1", "worker2"} <= names)
+
+        #Inner spans lie within the outer span of the same thread
+        for read in [ev for ev in spans if ev["name"] == "read"]:
+            copy = [ev for ev in spans if ev["name"] == "copy" and ev["tid"] == read["tid"]][0]
+            self.assertGreaterEqual(copy["ts"], read["ts"])
+            self.assertLessEqual(copy["ts"] + copy["dur"], read["ts"] + read["dur"])
+
+    def test_save(self):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "trace.json"
+
+            with nd2trace.tracing(path, instrumentSDK=False):
+                with nd2trace.span("getImage", seq_index=5):
+                    pass
+
+            with open(str(path)) as fh:
+                trace = json.load(fh)
+
+        self.assertFalse(nd2trace.isEnabled())
+        spans = [ev for ev in trace["traceEvents"] if ev["ph"] == "X"]
+        self.assertEqual(spans[0]["name"], "getImage")
+        self.assertEqual(spans[0]["args"], {"seq_index": 5})
+        self.assertGreaterEqual(spans[0]["dur"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import nd2tune
+from nd2reader import ND2reader, memory_report
+from pathlib import Path
+import tempfile
+
+class TestND2Tune(unittest.TestCase):
+
+    test_file = Path(__file__) / ".." / ".." / ".." / "sampleND2" / "sampleND2.nd2"
+
+    def setUp(self):
+        self.reader = ND2reader(str(self.test_file.resolve()))
+
+    def tearDown(self):
+        self.reader.close()
+
+    def test_calibrate(self):
+
+        result = nd2tune.calibrate(self.reader, numFrames=8, maxWorkers=4)
+        settings = result["settings"]
+
+        self.assertTrue(1 <= settings["numWorkers"] <= 4)
+        self.assertGreaterEqual(settings["prefetch"], 1)
+        self.assertIn("1", result["measurements"]["framesPerSecond"])
+
+    def test_samples(self):
+
+        #Every measurement reads different frames if the file is large enough
+        samples = [set(nd2tune._sample(1000, 32, trial, 4).tolist()) for trial in range(4)]
+
+        for trial in range(1, 4):
+            self.assertEqual(len(samples[trial]), 32)
+            self.assertEqual(samples[0] & samples[trial], set())
+
+    def test_prefetchDepth(self):
+
+        settings = {"prefetch": 8}
+
+        self.assertEqual(nd2tune.prefetchDepth(settings), 8)
+        self.assertEqual(nd2tune.prefetchDepth(settings, 4), 2)
+        self.assertEqual(nd2tune.prefetchDepth(settings, 20), 1)
+
+    def test_memoryLimit(self):
+
+        frameBytes = nd2tune.calibrate(self.reader, numFrames=2, maxWorkers=1)["measurements"]["frameBytes"]
+        limit = memory_report()["total"] + 10 * frameBytes
+        settings = nd2tune.calibrate(self.reader, memoryLimit=limit, numFrames=8)["settings"]
+
+        self.assertLessEqual((settings["numWorkers"] + settings["prefetch"]) * frameBytes
+                             + settings["cacheBytes"], 10 * frameBytes)
+
+    def test_autotune(self):
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "settings.json"
+            result = nd2tune.autotune(self.reader, path=path, numFrames=4, maxWorkers=2)
+
+            #Stored results are reused for files of the same type
+            self.assertEqual(nd2tune.autotune(self.reader, path=path), result)
+            self.assertIn(nd2tune.fileType(self.reader), nd2tune.loadSettings(path))
+
+
+if __name__ == "__main__":
+    unittest.main()